@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-call connection setup against the pooled data-access layer in db.py.
+
+The same single-row primary-key lookup on `urls` is run N times, first opening a
+fresh connection for every row (how every db.* function used to work) and then
+borrowing from db.get_connection(). Rows/sec is printed for both.
+
+Usage:
+    python benchmarks/bench_db_pool.py [config.yml] [rows]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mysql.connector as mysql  # noqa: E402
+import db  # noqa: E402
+
+QUERY = "SELECT id, url FROM urls WHERE id = %s"
+
+
+def sample_ids(db_config, rows) -> list:
+    with db.get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM urls ORDER BY id LIMIT %s", (rows,))
+        ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        sys.exit("The urls table is empty; nothing to benchmark.")
+    # Repeat ids if the table is smaller than the requested row count
+    return (ids * (rows // len(ids) + 1))[:rows]
+
+
+def run_unpooled(db_config, ids) -> float:
+    connect_args = {k: v for k, v in db_config.items() if k not in db._POOL_KEYS}
+    start = time.perf_counter()
+    for url_id in ids:
+        conn = mysql.connect(**connect_args)
+        cursor = conn.cursor()
+        cursor.execute(QUERY, (url_id,))
+        cursor.fetchall()
+        cursor.close()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def run_pooled(db_config, ids) -> float:
+    db.get_pool(db_config)  # build the pool outside the timed section
+    start = time.perf_counter()
+    for url_id in ids:
+        with db.get_connection(db_config) as conn, conn.cursor() as cursor:
+            cursor.execute(QUERY, (url_id,))
+            cursor.fetchall()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    config_file = sys.argv[1] if len(sys.argv) > 1 else 'config.yml'
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    db_config = db.load_config(config_file)['db_config']
+
+    ids = sample_ids(db_config, rows)
+    for label, runner in (("connect per row", run_unpooled), ("pooled", run_pooled)):
+        elapsed = runner(db_config, ids)
+        print(f"{label:>16}: {rows} rows in {elapsed:.3f}s -> {rows / elapsed:,.0f} rows/sec")
+
+    db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
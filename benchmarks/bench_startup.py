@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark how long the GUI takes to start.
+
+Two measurements, each in a fresh interpreter:
+
+  * import time: `python -X importtime -c "import gui"`, reporting the total and
+    the slowest modules by cumulative time;
+  * time to first frame: from interpreter start until URLManagerGUI has been
+    constructed and its first frame drawn, then until the browsers and domains
+    have arrived from the database.
+
+The second needs a display and config.yml. Compare the numbers before and after a
+change that touches imports or start-up work.
+
+Usage:
+    python benchmarks/bench_startup.py [runs] [top]
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# Run in the child: time from process start to first frame, then to loaded lookups
+FIRST_FRAME_SCRIPT = """
+import time
+start = time.perf_counter()
+from gui import URLManagerGUI, LOADING
+app = URLManagerGUI()
+app.update()
+first_frame = time.perf_counter() - start
+deadline = time.monotonic() + 30
+while (not app.browsers or app.domain_var.get() == LOADING) and time.monotonic() < deadline:
+    app.update()
+    time.sleep(0.005)
+loaded = time.perf_counter() - start
+print(f"{first_frame:.6f} {loaded:.6f}")
+app.destroy()
+"""
+
+
+def import_times(top) -> tuple:
+    """
+    Return (total seconds, [(cumulative seconds, module)...]) for `import gui`.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import gui"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"import gui failed:\n{result.stderr}")
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+            modules.append((cumulative / 1e6, indent, name))
+    # Top-level imports have the smallest indent; their cumulative times add up to the total
+    min_indent = min(indent for _, indent, _ in modules)
+    total = sum(seconds for seconds, indent, _ in modules if indent == min_indent)
+    slowest = sorted(((seconds, name) for seconds, _, name in modules), reverse=True)[:top]
+    return total, slowest
+
+
+def first_frame() -> tuple:
+    """
+    Return (seconds to first frame, seconds until the lookups are loaded), or None.
+    """
+    result = subprocess.run([sys.executable, "-c", FIRST_FRAME_SCRIPT],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Time to first frame not measured:\n{result.stderr.strip().splitlines()[-1]}")
+        return None
+    frame, loaded = result.stdout.split()[-2:]
+    return float(frame), float(loaded)
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    totals = []
+    for _ in range(runs):
+        total, slowest = import_times(top)
+        totals.append(total)
+    print(f"import gui: median {statistics.median(totals) * 1000:.1f} ms over {runs} runs")
+    print("slowest imports (cumulative, last run):")
+    for seconds, name in slowest:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    frames = []
+    for _ in range(runs):
+        measured = first_frame()
+        if measured is None:
+            return
+        frames.append(measured)
+    print(f"first frame: median {statistics.median(f for f, _ in frames) * 1000:.1f} ms, "
+          f"lookups loaded: median {statistics.median(l for _, l in frames) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
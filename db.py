@@ -1,43 +1,203 @@
 # db.py
-import mysql.connector as mysql
-import yaml
-import numpy as np
-import pandas as pd
-from datetime import datetime
+from __future__ import annotations
+from lazy import lazy_import
+from domain_matcher import DomainMatcher
+from weight_rules import WeightRules
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import csv
+import gzip
+import json
 import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Heavy dependencies are imported on first use, keeping GUI start-up fast
+mysql = lazy_import("mysql.connector")
+pooling = lazy_import("mysql.connector.pooling")
+yaml = lazy_import("yaml")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+# Optional, only needed for URL snapshots
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+pc = lazy_import("pyarrow.compute")
 
 """
 Module containing functions to commuinicate with the database. Currently using mysql.connector
 
+All functions borrow their connection from a process-wide pool (see get_connection()),
+so a connection is only opened once per pool slot rather than once per call.
+
 """
 
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 10.0  # seconds to wait for a free pooled connection
 
-def get_domain_from_url(url, db_config):
+# Keys of db_config that configure the pool rather than the connection itself.
+_POOL_KEYS = ('pool_size', 'pool_timeout')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(db_config) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in db_config.items()))
+
+
+def get_pool(db_config) -> pooling.MySQLConnectionPool:
     """
-    Retrieves the domain code from the database, based on a pattern match from the URL.
+    Return the process-wide connection pool for db_config, creating it on first use.
+
+    Args:
+        db_config (dict): Database configuration. The optional `pool_size` key sets
+            the number of pooled connections (default 5, mysql.connector allows up to 32)
+            and `pool_timeout` how many seconds to wait for a free one (default 10).
+
+    Returns:
+        MySQLConnectionPool: The shared pool for this configuration.
+    """
+    key = _pool_key(db_config)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            connect_args = {k: v for k, v in db_config.items() if k not in _POOL_KEYS}
+            pool = pooling.MySQLConnectionPool(
+                pool_name=f"mu_pool_{len(_pools)}",
+                pool_size=int(db_config.get('pool_size', DEFAULT_POOL_SIZE)),
+                pool_reset_session=True,
+                **connect_args)
+            _pools[key] = pool
+            logging.info(f"Created MySQL connection pool {pool.pool_name} of size {pool.pool_size}")
+    return pool
+
+
+@contextmanager
+def get_connection(db_config):
+    """
+    Borrow a connection from the pool for the duration of a `with` block.
+
+    The connection is pinged before use and transparently reconnected if the server
+    has dropped it (wait_timeout, server restart, ...). On exit it goes back to the
+    pool, which resets the session so uncommitted work is rolled back.
+
+    Args:
+        db_config (dict): Database configuration.
+
+    Yields:
+        PooledMySQLConnection: A live connection.
+    """
+    pool = get_pool(db_config)
+    deadline = time.monotonic() + float(db_config.get('pool_timeout', DEFAULT_POOL_TIMEOUT))
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except mysql.PoolError:
+            # Pool exhausted: wait for another thread to hand a connection back
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+    try:
+        conn.ping(reconnect=True, attempts=3, delay=1)
+        yield conn
+    finally:
+        try:
+            conn.close()  # returns the connection to the pool
+        except mysql.Error as e:
+            logging.warning(f"Error returning connection to the pool: {e}")
+
+
+def close_pools() -> None:
+    """
+    Close every idle pooled connection, e.g. on application exit.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool._remove_connections()
+        _pools.clear()
+
+
+DOMAIN_MATCHER_MAX_AGE = 300.0  # seconds before the domain patterns are re-read
+
+_domain_matchers = {}  # pool key -> (DomainMatcher, time loaded)
+_domain_matchers_lock = threading.Lock()
+
+
+def refresh_domain_matcher(db_config) -> DomainMatcher:
+    """
+    Reload the `domains` patterns and rebuild the in-memory matcher.
+
+    Call this after changing the `domains` table; otherwise the matcher is also
+    rebuilt once it is older than DOMAIN_MATCHER_MAX_AGE.
 
     Args:
-        url (str): The URL to check.
         db_config (dict): Database configuration.
 
     Returns:
-        str: The domain code if a match is found, or None if no match.
+        DomainMatcher: The new matcher.
+    """
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT pattern, domain FROM domains")
+        matcher = DomainMatcher(cursor.fetchall())
+    with _domain_matchers_lock:
+        _domain_matchers[_pool_key(db_config)] = (matcher, time.monotonic())
+    logging.info(f"Loaded {len(matcher)} domain patterns.")
+    return matcher
+
+
+def get_domain_matcher(db_config) -> DomainMatcher:
+    """
+    Return the cached domain matcher, loading or refreshing it when needed.
+
+    Args:
+        db_config (dict): Database configuration.
+
+    Returns:
+        DomainMatcher: The matcher for this database.
+    """
+    with _domain_matchers_lock:
+        cached = _domain_matchers.get(_pool_key(db_config))
+    if cached and time.monotonic() - cached[1] < DOMAIN_MATCHER_MAX_AGE:
+        return cached[0]
+    return refresh_domain_matcher(db_config)
+
+
+def infer_domains(urls, db_config) -> list:
+    """
+    Retrieve the domain code of each URL, based on the `domains` patterns.
+
+    Args:
+        urls (iterable): The URLs to check.
+        db_config (dict): Database configuration.
+
+    Returns:
+        list: The domain code for each URL, or None where no pattern matches.
+    """
+    return get_domain_matcher(db_config).match_many(urls)
+
+
+def get_domain_from_url(url, db_config):
     """
-    # Connect to the database
-    conn = mysql.connect(**db_config)
-    cursor = conn.cursor()
+    Retrieves the domain code based on a pattern match from the URL.
 
-    # Query to check for a matching pattern in the `domains` table,
-    # preventing an SQL injection attack.
-    query = "SELECT domain FROM domains WHERE %s LIKE CONCAT('%%', pattern, '%%') LIMIT 1;"
-    cursor.execute(query, (url,))
-    result = cursor.fetchone()
+    The `domains` patterns are matched in memory (see get_domain_matcher()),
+    so no query is sent per URL.
 
-    # Clean up and close connection
-    cursor.close()
-    conn.close()
+    Args:
+        url (str): The URL to check.
+        db_config (dict): Database configuration.
 
-    return result[0] if result else None
+    Returns:
+        str: The domain code if a match is found, or None if no match.
+    """
+    return get_domain_matcher(db_config).match(url)
 
 
 def load_config(config_file='config.yml') -> dict:
@@ -63,44 +223,181 @@ def get_browsers(db_config) -> list:
         dict: Dictionary of browser configurations keyed by browser name.
     """
     browsers_dict = {}
-    try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
         cursor.execute("SELECT id, name, vpn_code, command FROM browsers")
         for (id, name, vpn_code, command) in cursor:
             browsers_dict[name] = {
                 "id": id, "vpn": vpn_code, "command": command}
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
     return browsers_dict
 
 
-def get_all_urls(db_config, domain=None) -> list:
+URL_COLUMNS = ('id', 'url', 'domain', 'weight')
+
+
+def get_all_urls(db_config, domain=None, columns=None) -> list:
     """
     Retrieve all URLs from the database, optionally filtered by domain.
 
     Args:
         db_config (dict): Database configuration parameters.
         domain (str, optional): Domain to filter URLs by. Defaults to None.
+        columns (tuple, optional): Columns of `urls` to return, from URL_COLUMNS.
+            Defaults to None, which returns just the URL strings.
 
     Returns:
-        list: List of URLs.
+        list: List of URLs, or of tuples of the requested columns, in id order
+        when columns are given.
     """
-    conn = mysql.connect(**db_config)
-    cursor = conn.cursor()
-    query = "SELECT url FROM urls"
+    if columns is not None:
+        unknown = set(columns) - set(URL_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown urls columns: {sorted(unknown)}")
+    query = f"SELECT {', '.join(columns or ('url',))} FROM urls"
     params = ()
     if domain:
         query += " WHERE domain = %s"
         params = (domain,)
-    cursor.execute(query, params)
-    urls = [item[0] for item in cursor.fetchall()]
+    if columns is not None:
+        query += " ORDER BY id"
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(query, params)
+        if columns is None:
+            return [item[0] for item in cursor.fetchall()]
+        return cursor.fetchall()
+
+
+@contextmanager
+def stream_query(db_config, query, params=()):
+    """
+    Run a query on an unbuffered cursor, for reading a large result in chunks with
+    fetchmany() without holding it all in memory.
+
+    If the block exits before the last row was read (cancelled, or an error), the
+    query is stopped with KILL QUERY from a second connection rather than pulling
+    the rest of the result over the wire, and the connection goes back to the pool
+    with nothing left to read. Errors while cleaning up are logged, never raised, so
+    they cannot hide the error that ended the block.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        query (str): The SELECT to run.
+        params (tuple): Its parameters.
 
-    cursor.close()
-    conn.close()
-    return urls
+    Yields:
+        MySQLCursor: The unbuffered cursor, with the query executed.
+    """
+    with get_connection(db_config) as conn:
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(query, params)
+            yield cursor
+        finally:
+            try:
+                if conn.unread_result:
+                    _stop_query(db_config, conn, cursor)
+                cursor.close()
+            except mysql.Error as e:
+                logging.warning(f"Error closing a streamed query: {e}")
+
+
+def _stop_query(db_config, conn, cursor) -> None:
+    try:
+        with get_connection(db_config) as killer, killer.cursor() as kill_cursor:
+            kill_cursor.execute(f"KILL QUERY {int(conn.connection_id)}")
+    except mysql.Error as e:
+        logging.warning(f"Could not stop query on connection {conn.connection_id}: {e}")
+    try:
+        # Only the rows already in flight are left before the interruption error
+        while cursor.fetchmany(1000):
+            pass
+    except mysql.Error as e:
+        logging.info(f"Streamed query stopped: {e}")
+
+
+EXPORT_COLUMNS = {
+    'id': "urls.id",
+    'url': "urls.url",
+    'domain': "urls.domain",
+    'weight': "urls.weight",
+    # Served by the (URL_id, timestamp) index, one lookup per URL
+    'last_opened': "(SELECT MAX(timestamp) FROM URL_open_history WHERE URL_open_history.URL_id = urls.id)",
+}
+DEFAULT_EXPORT_CHUNK = 5000
+
+
+def export_urls_csv(db_config, filename, domain=None, columns=('url',), header=True,
+                    compress=None, chunk_size=DEFAULT_EXPORT_CHUNK,
+                    progress_callback=None, cancel_event=None) -> dict:
+    """
+    Stream URLs from the database into a CSV file, optionally gzip-compressed.
+
+    Rows are read through an unbuffered cursor and written `chunk_size` at a time,
+    so memory use stays flat whatever the number of URLs. The file is written under
+    a temporary name and renamed when complete, so a failed or cancelled export
+    never leaves a partial file behind.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        filename (str): Output file.
+        domain (str, optional): Only export URLs of this domain.
+        columns (tuple): Columns to export, from EXPORT_COLUMNS, in order.
+        header (bool): Write the column names as the first line.
+        compress (bool, optional): gzip the output. Defaults to True if the
+            filename ends in '.gz'.
+        chunk_size (int): Rows fetched and written per chunk.
+        progress_callback (callable, optional): Called after each chunk with a dict
+            of 'rows' written so far and the 'total' to write.
+        cancel_event (threading.Event, optional): Stop early when set.
+
+    Returns:
+        dict: 'rows' written and whether the export 'completed'.
+    """
+    unknown = set(columns) - set(EXPORT_COLUMNS)
+    if unknown or not columns:
+        raise ValueError(f"Unknown or no export columns: {sorted(unknown)}")
+    if compress is None:
+        compress = filename.endswith('.gz')
+
+    where, params = ("WHERE urls.domain = %s", (domain,)) if domain else ("", ())
+    select = ", ".join(EXPORT_COLUMNS[column] for column in columns)
+    tmp_file = filename + '.part'
+    rows_written = 0
+    completed = False
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM urls {where}", params)
+        total = cursor.fetchone()[0]
+
+    query = f"SELECT {select} FROM urls {where} ORDER BY urls.id"
+    with stream_query(db_config, query, params) as cursor:
+        try:
+            with (gzip.open(tmp_file, 'wt', newline='') if compress
+                  else open(tmp_file, 'w', newline='')) as file:
+                writer = csv.writer(file)
+                if header:
+                    writer.writerow(columns)
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        completed = True
+                        break
+                    writer.writerows(chunk)
+                    rows_written += len(chunk)
+                    if progress_callback:
+                        progress_callback({'rows': rows_written, 'total': total})
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    if completed:
+        os.replace(tmp_file, filename)
+        logging.info(f"Exported {rows_written} URLs to {filename}.")
+    else:
+        os.remove(tmp_file)
+        logging.info(f"Export to {filename} cancelled after {rows_written} URLs.")
+    return {'rows': rows_written, 'completed': completed}
 
 
 def insert_url(db_config, url, domain, weight) -> None:
@@ -114,17 +411,17 @@ def insert_url(db_config, url, domain, weight) -> None:
 
     """
     try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
-        # query = "INSERT INTO urls (url, domain) VALUES (%s, %s) ON DUPLICATE KEY UPDATE url=url;"
-        query = """
-        INSERT INTO urls (url, domain, weight)
-        VALUES (%s, %s, %s)
-        ON DUPLICATE KEY UPDATE url=url;
-        """
-
-        cursor.execute(query, (url, domain, weight))
-        conn.commit()
+        with get_connection(db_config) as conn, conn.cursor() as cursor:
+            # query = "INSERT INTO urls (url, domain) VALUES (%s, %s) ON DUPLICATE KEY UPDATE url=url;"
+            query = """
+            INSERT INTO urls (url, domain, weight)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE url=url;
+            """
+
+            cursor.execute(query, (url, domain, weight))
+            conn.commit()
+        invalidate_domain_sampler(db_config, domain)
     except mysql.IntegrityError as e:
         logging.error(f"Integrity error inserting URL: {url}. Error: {e}")
         # Handle data integrity issues, e.g., rollback, notify user
@@ -134,31 +431,497 @@ def insert_url(db_config, url, domain, weight) -> None:
     except mysql.Error as e:
         logging.error(f"General MySQL error: {e}")
         # Handle other MySQL errors
+
+
+DEFAULT_UPLOAD_BATCH_SIZE = 1000
+
+INSERT_URLS_QUERY = """
+INSERT INTO urls (url, domain, weight)
+VALUES (%s, %s, %s)
+ON DUPLICATE KEY UPDATE url=url
+"""
+
+# Duplicate key error, reported as a warning for the rows LOAD DATA ... IGNORE skips
+ER_DUP_ENTRY = 1062
+
+LOAD_URLS_QUERY = """
+LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE urls
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+LINES TERMINATED BY '\\n'
+(url, domain, weight)
+"""
+
+
+def is_valid_url(url) -> bool:
+    """
+    Check that a line from an upload file looks like an http(s) URL.
+
+    Args:
+        url (str): The stripped line.
+
+    Returns:
+        bool: True if the URL can be stored.
+    """
+    if any(char.isspace() for char in url):
+        return False
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    return parts.scheme in ('http', 'https') and bool(parts.netloc)
+
+
+def _insert_url_batch(cursor, rows) -> int:
+    # mysql.connector rewrites executemany() of an INSERT into a single
+    # multi-row INSERT statement. Duplicates leave the row unchanged, so they
+    # add nothing to rowcount.
+    cursor.executemany(INSERT_URLS_QUERY, rows)
+    return cursor.rowcount
+
+
+def _load_url_batch(cursor, rows) -> int:
+    # LOAD DATA LOCAL INFILE fast path. Needs allow_local_infile: true in db_config
+    # and local_infile enabled on the server. IGNORE skips duplicate URLs.
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False) as tmp:
+        for url, domain, weight in rows:
+            escaped_url = url.replace('\\', '\\\\')
+            tmp.write(f"{escaped_url}\t{domain}\t{weight}\n")
+    try:
+        cursor.execute(LOAD_URLS_QUERY, (tmp.name,))
+        loaded = cursor.rowcount
+        # Read now: SHOW WARNINGS below resets it to its own count
+        warning_count = cursor.warning_count
     finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+        os.remove(tmp.name)
+    # IGNORE also turns data errors into warnings: a URL too long for the column
+    # would be stored truncated. Refuse the batch unless every warning is a skipped
+    # duplicate, so that _write_url_batch retries it row by row and only the bad
+    # rows are rejected.
+    if warning_count:
+        cursor.execute("SHOW WARNINGS")
+        warnings = cursor.fetchall()
+        problems = [warning for warning in warnings if warning[1] != ER_DUP_ENTRY]
+        if problems or len(warnings) < warning_count:
+            raise mysql.DataError(msg=f"LOAD DATA reported {warning_count} warnings, e.g. "
+                                      f"{problems[0][2] if problems else 'more than SHOW WARNINGS lists'}")
+    return loaded
+
+
+def _write_url_batch(conn, rows, use_load_data=False) -> tuple:
+    """
+    Write one batch of (url, domain, weight) rows as a single transaction.
 
+    If the batch is refused because of bad data (e.g. a URL too long for the column),
+    it is rolled back and retried row by row so that only the offending rows are lost.
 
-def upload_urls_from_file(db_config, filename, domain) -> int:
+    Returns:
+        tuple: (inserted, rejected) row counts.
+    """
+    try:
+        with conn.cursor() as cursor:
+            writer = _load_url_batch if use_load_data else _insert_url_batch
+            inserted = writer(cursor, rows)
+        conn.commit()
+        return inserted, 0
+    except (mysql.DataError, mysql.IntegrityError) as e:
+        conn.rollback()
+        logging.warning(f"Batch of {len(rows)} URLs failed ({e}), retrying row by row.")
+
+    inserted = rejected = 0
+    with conn.cursor() as cursor:
+        for row in rows:
+            try:
+                cursor.execute(INSERT_URLS_QUERY, row)
+                inserted += cursor.rowcount
+            except (mysql.DataError, mysql.IntegrityError) as e:
+                rejected += 1
+                logging.error(f"Rejected URL: {row[0]}. Error: {e}")
+    conn.commit()
+    return inserted, rejected
+
+
+def _open_upload_file(filename):
+    # gzip input is detected from its magic number rather than the file name
+    with open(filename, 'rb') as file:
+        is_gzip = file.read(2) == b'\x1f\x8b'
+    return gzip.open(filename, 'rb') if is_gzip else open(filename, 'rb')
+
+
+def _read_lines(file, start_offset=0, start_line=0):
     """
-    Upload multiple URLs from a file to the database.
+    Yield (line_number, end_offset, text) for each line of an open binary file,
+    starting at a byte offset of the (decompressed) stream.
+    """
+    if start_offset:
+        file.seek(start_offset)
+    offset, line_number = start_offset, start_line
+    for raw in file:
+        offset += len(raw)
+        line_number += 1
+        yield line_number, offset, raw.decode('utf-8', errors='replace')
+
+
+def _valid_url_lines(lines, counts, filename):
+    """
+    Strip each line and drop blanks and invalid URLs, counting the latter as rejected.
+    """
+    for line_number, offset, text in lines:
+        url = text.strip()
+        if not url:
+            continue
+        if not is_valid_url(url):
+            counts['rejected'] += 1
+            logging.warning(f"Skipping invalid URL at {filename}:{line_number}: {url}")
+            continue
+        yield line_number, offset, url
+
+
+def _classify_urls(urls, domain, matcher, counts, filename):
+    """
+    Attach a domain to each URL: the fixed `domain` if given, otherwise the one
+    inferred by `matcher`. URLs matching no domain pattern are rejected.
+    """
+    for line_number, offset, url in urls:
+        url_domain = domain or matcher.match(url)
+        if url_domain is None:
+            counts['rejected'] += 1
+            logging.warning(f"No domain pattern matches URL at {filename}:{line_number}: {url}")
+            continue
+        yield line_number, offset, url, url_domain
+
+
+def _batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _weigh_batch(batch, weight, weight_rules, counts, filename) -> list:
+    """
+    Turn a batch of classified URLs into (url, domain, weight) rows, inferring the
+    weights in one vectorized pass unless a fixed weight is given. URLs whose
+    weight cannot be inferred are rejected.
+    """
+    if weight is not None:
+        return [(url, url_domain, weight) for _, _, url, url_domain in batch]
+
+    urls = [item[2] for item in batch]
+    weights, valid = weight_rules.infer_many(urls, [item[3] for item in batch])
+    rows = []
+    for (line_number, _, url, url_domain), url_weight, ok in zip(batch, weights.tolist(), valid):
+        if ok:
+            rows.append((url, url_domain, url_weight))
+        else:
+            counts['rejected'] += 1
+            logging.warning(f"Cannot infer a weight for URL at {filename}:{line_number}: {url}")
+    return rows
+
+
+def _file_signature(filename) -> dict:
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _load_checkpoint(checkpoint_file, filename, domain):
+    try:
+        with open(checkpoint_file, 'r') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable upload checkpoint {checkpoint_file}: {e}")
+        return None
+    if checkpoint.get('file') != _file_signature(filename) or checkpoint.get('domain') != domain:
+        logging.warning(f"Ignoring upload checkpoint {checkpoint_file}: the file or domain has changed.")
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_file, checkpoint) -> None:
+    # Write to a temporary file and rename, so a crash never leaves a torn checkpoint
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def upload_urls_from_file(db_config, filename, domain, weight=None, weight_rules=None,
+                          batch_size=DEFAULT_UPLOAD_BATCH_SIZE, use_load_data=False,
+                          progress_callback=None, cancel_event=None,
+                          checkpoint_file=None, resume=True) -> dict:
+    """
+    Upload multiple URLs from a file to the database, one line per URL.
+
+    The file is streamed through read -> strip/validate -> batch -> write, so memory
+    use is bounded by one batch whatever the file size. gzip-compressed files are
+    accepted. Each batch of `batch_size` rows is one multi-row INSERT ... ON DUPLICATE
+    KEY and one transaction, over a single pooled connection.
+
+    After every committed batch the byte offset and line number reached are saved to
+    a checkpoint file. If the upload crashes or is cancelled, calling this again with
+    the same file and domain resumes after the last committed batch. The checkpoint
+    is removed once the whole file has been processed.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        filename (str): Path to the file containing URLs, optionally gzip-compressed.
+        domain (str): The domain associated with URLs. If None, each URL's domain is
+            inferred from the `domains` patterns in memory, and URLs that match no
+            pattern are rejected.
+        weight (int, optional): Sampling weight given to every uploaded URL. If None,
+            each URL's weight is inferred by `weight_rules`, and URLs they cannot
+            weigh are rejected.
+        weight_rules (WeightRules, optional): Rules used when weight is None.
+            Defaults to the built-in page-number thresholds.
+        batch_size (int): Number of rows per INSERT and transaction.
+        use_load_data (bool): Load each batch with LOAD DATA LOCAL INFILE instead of
+            INSERT. Requires `allow_local_infile: true` in db_config.
+        progress_callback (callable, optional): Called after each batch with a dict
+            of the counts so far plus 'lines', 'bytes_read' and 'total_bytes'
+            (both measured on the file as stored, i.e. compressed for gzip).
+        cancel_event (threading.Event, optional): Checked between batches; when set
+            the upload stops, keeping its checkpoint.
+        checkpoint_file (str, optional): Where to keep the checkpoint.
+            Defaults to `filename` + '.checkpoint'.
+        resume (bool): Resume from an existing checkpoint. If False it is discarded.
+
+    Returns:
+        dict: Counts of 'inserted' new URLs, 'duplicate' URLs already present and
+        'rejected' lines that are not valid URLs or that the database refused, the
+        number of 'lines' read and whether the upload 'completed'. Counts include
+        those of the run being resumed.
+    """
+    checkpoint_file = checkpoint_file or filename + '.checkpoint'
+    weight_rules = weight_rules or WeightRules.from_config({})
+    checkpoint = _load_checkpoint(checkpoint_file, filename, domain) if resume else None
+    counts = {'inserted': 0, 'duplicate': 0, 'rejected': 0}
+    start_offset = start_line = 0
+    if checkpoint:
+        counts.update(checkpoint['counts'])
+        start_offset, start_line = checkpoint['offset'], checkpoint['line']
+        logging.info(f"Resuming upload of {filename} from line {start_line}.")
+
+    total_bytes = os.path.getsize(filename)
+    line_number = start_line
+    completed = False
+
+    with _open_upload_file(filename) as file, get_connection(db_config) as conn:
+        raw_file = getattr(file, 'fileobj', file)  # compressed stream for gzip
+        lines = _read_lines(file, start_offset, start_line)
+        urls = _valid_url_lines(lines, counts, filename)
+        matcher = None if domain else get_domain_matcher(db_config)
+        classified = _classify_urls(urls, domain, matcher, counts, filename)
+        for batch in _batched(classified, batch_size):
+            rows = _weigh_batch(batch, weight, weight_rules, counts, filename)
+            inserted, rejected = _write_url_batch(conn, rows, use_load_data) if rows else (0, 0)
+            counts['inserted'] += inserted
+            counts['rejected'] += rejected
+            counts['duplicate'] += len(rows) - inserted - rejected
+
+            line_number, offset = batch[-1][0], batch[-1][1]
+            _save_checkpoint(checkpoint_file, {
+                'file': _file_signature(filename), 'domain': domain,
+                'offset': offset, 'line': line_number, 'counts': counts})
+            if progress_callback:
+                progress_callback(dict(counts, lines=line_number,
+                                       bytes_read=raw_file.tell(), total_bytes=total_bytes))
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info(f"Upload of {filename} cancelled at line {line_number}.")
+                break
+        else:
+            completed = True
+
+    if completed:
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        if progress_callback:
+            progress_callback(dict(counts, lines=line_number,
+                                   bytes_read=total_bytes, total_bytes=total_bytes))
+
+    # Without a fixed domain any domain may have changed
+    invalidate_domain_sampler(db_config, domain)
+    logging.info(f"Uploaded {filename}: {counts}")
+    return dict(counts, lines=line_number, completed=completed)
+
+
+SNAPSHOT_COLUMNS = ('id', 'url', 'domain', 'weight')
+SNAPSHOT_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+DEFAULT_SNAPSHOT_CHUNK = 100000
+# is_valid_url() as a vectorized regex: http(s) scheme, a host, no whitespace
+SNAPSHOT_URL_PATTERN = r'^(?i:https?)://[^\s/?#]+\S*$'
+
+
+def _snapshot_format(filename) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Snapshot file must end in one of {', '.join(SNAPSHOT_FORMATS)}: {filename}")
+    return SNAPSHOT_FORMATS[extension]
+
+
+def _snapshot_schema():
+    return pa.schema([('id', pa.int64()), ('url', pa.string()),
+                      ('domain', pa.string()), ('weight', pa.int64())])
+
+
+def export_urls_snapshot(db_config, filename, domain=None, chunk_size=DEFAULT_SNAPSHOT_CHUNK,
+                         progress_callback=None, cancel_event=None) -> dict:
+    """
+    Write the urls table (id, url, domain, weight) to a Parquet or Arrow IPC file.
+
+    The format follows the extension: '.parquet', or '.arrow'/'.feather' for the
+    Arrow IPC file format. Both are zstd-compressed. Rows are streamed from an
+    unbuffered cursor and written as one row group (record batch) per chunk, so
+    memory is bounded by `chunk_size` rows. Needs pyarrow.
 
     Args:
         db_config (dict): Database configuration parameters.
-        filename (str): Path to the file containing URLs.
-        domain (str): The domain associated with URLs.
+        filename (str): Output file.
+        domain (str, optional): Only export URLs of this domain.
+        chunk_size (int): Rows per row group.
+        progress_callback (callable, optional): Called after each chunk with a dict
+            of 'rows' written so far and the 'total' to write.
+        cancel_event (threading.Event, optional): Stop early when set.
 
     Returns:
-        int: The number of URLs uploaded.
+        dict: 'rows' written and whether the export 'completed'.
     """
-    count: int = 0
-    with open(filename, 'r') as file:
-        urls: list = [line.strip() for line in file if line.strip()]
-        for url in urls:
-            insert_url(db_config, url, domain)
-            count += 1
-    return count  # Return the number of URLs uploaded
+    file_format = _snapshot_format(filename)
+    schema = _snapshot_schema()
+    where, params = ("WHERE domain = %s", (domain,)) if domain else ("", ())
+    tmp_file = filename + '.part'
+    rows_written = 0
+    completed = False
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM urls {where}", params)
+        total = cursor.fetchone()[0]
+
+    query = f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM urls {where} ORDER BY id"
+    with stream_query(db_config, query, params) as cursor:
+        try:
+            if file_format == 'parquet':
+                writer = pq.ParquetWriter(tmp_file, schema, compression='zstd')
+            else:
+                writer = pa.ipc.new_file(tmp_file, schema,
+                                         options=pa.ipc.IpcWriteOptions(compression='zstd'))
+            with writer:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        completed = True
+                        break
+                    arrays = [pa.array(values, type=field.type)
+                              for values, field in zip(zip(*chunk), schema)]
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                    rows_written += len(chunk)
+                    if progress_callback:
+                        progress_callback({'rows': rows_written, 'total': total})
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    if completed:
+        os.replace(tmp_file, filename)
+        logging.info(f"Exported {rows_written} URLs to snapshot {filename}.")
+    else:
+        os.remove(tmp_file)
+        logging.info(f"Snapshot export to {filename} cancelled after {rows_written} URLs.")
+    return {'rows': rows_written, 'completed': completed}
+
+
+def _snapshot_batches(filename, batch_size):
+    # Yield the number of rows in the file, then the (url, domain, weight) columns
+    # of each batch, without reading the whole file: Parquet row groups are read
+    # one at a time and Arrow IPC is memory-mapped
+    columns = ['url', 'domain', 'weight']
+    if _snapshot_format(filename) == 'parquet':
+        parquet_file = pq.ParquetFile(filename)
+        total = parquet_file.metadata.num_rows
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+        yield total
+        for batch in batches:
+            yield batch
+    else:
+        with pa.memory_map(filename) as source:
+            reader = pa.ipc.open_file(source)
+            yield reader.count_rows()
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for offset in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(offset, batch_size)
+
+
+def import_urls_snapshot(db_config, filename, domain=None, batch_size=DEFAULT_SNAPSHOT_CHUNK,
+                         use_load_data=True, progress_callback=None, cancel_event=None) -> dict:
+    """
+    Load URLs from a snapshot written by export_urls_snapshot() into the urls table.
+
+    Batches go through the same bulk path as file uploads (LOAD DATA LOCAL INFILE
+    by default, else multi-row INSERTs), one transaction each. URLs already in the
+    table are left as they are. The snapshot's ids are not kept: rows get new ids
+    in the target database, as their history does not travel with them.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        filename (str): A '.parquet', '.arrow' or '.feather' snapshot.
+        domain (str, optional): Store every URL under this domain instead of the
+            domain recorded in the snapshot.
+        batch_size (int): Rows per bulk load and transaction.
+        use_load_data (bool): Load each batch with LOAD DATA LOCAL INFILE instead
+            of INSERT. Requires `allow_local_infile: true` in db_config.
+        progress_callback (callable, optional): Called after each batch with a dict
+            of the counts so far plus 'rows' read and the 'total' in the file.
+        cancel_event (threading.Event, optional): Checked between batches.
+
+    Returns:
+        dict: Counts of 'inserted', 'duplicate' and 'rejected' URLs, the 'rows' read
+        and whether the import 'completed'.
+    """
+    counts = {'inserted': 0, 'duplicate': 0, 'rejected': 0}
+    rows_read = 0
+    completed = False
+    batches = _snapshot_batches(filename, batch_size)
+    total = next(batches)
+    with get_connection(db_config) as conn:
+        for batch in batches:
+            # Validate the whole batch at once; a Python check per URL would cost
+            # more than the load itself
+            valid = pc.and_kleene(pc.match_substring_regex(batch.column('url'), SNAPSHOT_URL_PATTERN),
+                                  batch.column('weight').is_valid())
+            if not domain:
+                valid = pc.and_kleene(valid, pc.not_equal(batch.column('domain'), ''))
+            batch_valid = batch.filter(valid.fill_null(False))
+            if batch_valid.num_rows < batch.num_rows:
+                counts['rejected'] += batch.num_rows - batch_valid.num_rows
+                logging.warning(f"Rejected {batch.num_rows - batch_valid.num_rows} invalid rows "
+                                f"of snapshot {filename}.")
+            domains = [domain] * batch_valid.num_rows if domain else batch_valid.column('domain').to_pylist()
+            rows = list(zip(batch_valid.column('url').to_pylist(), domains,
+                            batch_valid.column('weight').to_pylist()))
+            inserted, rejected = _write_url_batch(conn, rows, use_load_data) if rows else (0, 0)
+            counts['inserted'] += inserted
+            counts['rejected'] += rejected
+            counts['duplicate'] += len(rows) - inserted - rejected
+            rows_read += batch.num_rows
+            if progress_callback:
+                progress_callback(dict(counts, rows=rows_read, total=total))
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info(f"Import of {filename} cancelled after {rows_read} rows.")
+                break
+        else:
+            completed = True
+
+    invalidate_domain_sampler(db_config, domain)
+    logging.info(f"Imported snapshot {filename}: {counts}")
+    return dict(counts, rows=rows_read, completed=completed)
 
 
 def clear_all_urls(db_config) -> None:
@@ -168,24 +931,18 @@ def clear_all_urls(db_config) -> None:
     Args:
         db_config (dict): Database configuration parameters.
     """
-    try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
         cursor.execute("DELETE FROM urls")
         conn.commit()
         print("All URLs have been deleted.")
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+    invalidate_domain_sampler(db_config)
 
 
 def get_domains(db_config) -> tuple:
 
-    conn = mysql.connect(**db_config)
-    cursor = conn.cursor()
-    cursor.execute("SELECT domain, default_domain FROM domains")
-    domains = cursor.fetchall()
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT domain, default_domain FROM domains")
+        domains = cursor.fetchall()
 
     default_domain = None
     domain_list = []
@@ -194,9 +951,6 @@ def get_domains(db_config) -> tuple:
         if is_default:
             default_domain = domain
 
-    cursor.close()
-    conn.close()
-
     return domain_list, default_domain
 
 
@@ -212,193 +966,750 @@ def insert_into_urls_opened(db_config, url_id) -> bool:
         boolean: True if the insertion was successful, False if unsuccessful.
     """
     try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
-        # Use placeholders for safe query construction
-        query = "INSERT INTO urls_opened (url_id, time_opened) VALUES (%s, NOW());"
-        cursor.execute(query, (url_id,))
-        conn.commit()  # Commit the transaction to save changes
+        with get_connection(db_config) as conn, conn.cursor() as cursor:
+            # Use placeholders for safe query construction
+            query = "INSERT INTO urls_opened (url_id, time_opened) VALUES (%s, NOW());"
+            cursor.execute(query, (url_id,))
+            conn.commit()  # Commit the transaction to save changes
         return True
     except mysql.Error as e:
         logging.error(f"Error inserting URL into urls_opened: {e}")
         return False
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
 
 
-def weighted_sample_without_replacement(db_config, needed, domain) -> list:
+def weighted_sample_indices(weights, needed, rng=None) -> np.ndarray:
     """
-    Samples URLs from the database without replacement, according to their weights.
+    Draw up to `needed` distinct indices, with probability proportional to weight.
+
+    Uses Efraimidis-Spirakis exponential keys: each item gets the key log(u) / w for
+    u ~ U(0, 1], and the `needed` largest keys win. This is equivalent to drawing one
+    item at a time with probability weight / remaining total weight, so the first draw
+    has exactly the probabilities of sampling a table with `weight` copies of each row,
+    without ever building that table. Runs in O(n) time and memory.
 
     Args:
-        db_config (dict): Database configuration parameters.
-        needed (int): Number of URLs needed.
+        weights (array-like): Non-negative weights. Items with weight 0 are never drawn.
+        needed (int): Number of indices to draw. If it exceeds the number of items with
+            a positive weight, all of them are returned.
+        rng (np.random.Generator, optional): Random generator, for reproducible draws.
 
     Returns:
-        list: List of sampled URLs.
+        np.ndarray: Indices into `weights`, in draw order.
     """
-    # Connect to the database and fetch URLs and weights
-    try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
-        query = "SELECT id, url, weight FROM urls"
-        params = ()  # Initialize params as an empty tuple
-        if domain:
-            query += " WHERE domain = %s"
-            params = (domain,)  # Add domain to params
+    rng = rng if rng is not None else np.random.default_rng()
+    weights = np.asarray(weights, dtype=np.float64)
 
-        cursor.execute(query, params)
-        urls_data = cursor.fetchall()
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+    eligible = np.flatnonzero(weights > 0)
+    needed = min(max(int(needed), 0), eligible.size)
+    if needed == 0:
+        return np.empty(0, dtype=np.intp)
+
+    # 1 - random() lies in (0, 1], so the log is finite
+    keys = np.log1p(-rng.random(eligible.size)) / weights[eligible]
+    if needed < eligible.size:
+        top = np.argpartition(keys, eligible.size - needed)[eligible.size - needed:]
+    else:
+        top = np.arange(eligible.size)
+    top = top[np.argsort(keys[top])[::-1]]
+    return eligible[top]
 
-    if not urls_data:
+
+def fetch_urls_by_id(cursor, ids) -> list:
+    """
+    Look up the URLs for a list of ids, keeping the order of `ids`.
+
+    Args:
+        cursor: An open cursor.
+        ids (list): URL ids.
+
+    Returns:
+        list: List of (id, url) tuples for the ids that exist.
+    """
+    if not ids:
         return []
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(f"SELECT id, url FROM urls WHERE id IN ({placeholders})", tuple(ids))
+    urls_by_id = dict(cursor.fetchall())
+    return [(url_id, urls_by_id[url_id]) for url_id in ids if url_id in urls_by_id]
 
-    # Separate IDs, URLs, and weights
-    ids, urls, weights = zip(*urls_data)
 
-    # Convert weights to probabilities, ensuring they sum to 1
-    total_weight = sum(weights)
-    probabilities = [weight / total_weight for weight in weights]
+URL_STATS_QUERY = (
+    "SELECT urls.id, urls.weight, COALESCE(SUM(url_open_daily.open_count), 0) FROM urls "
+    "LEFT JOIN url_open_daily ON url_open_daily.url_id = urls.id "
+    "WHERE urls.id IN ({placeholders}) GROUP BY urls.id, urls.weight")
 
-    # Sample URLs based on their weights without replacement
-    sampled_indices = np.random.choice(
-        len(urls), size=needed, replace=False, p=probabilities)
-    sampled_urls_with_ids = [(ids[i], urls[i]) for i in sampled_indices]
 
-    return sampled_urls_with_ids
+def get_url_stats(db_config, ids) -> dict:
+    """
+    Look up the weight and the number of times opened of each URL id.
 
+    Args:
+        db_config (dict): Database configuration parameters.
+        ids (list): URL ids.
 
-def weighted_sample_without_replacement_new(db_config, needed, domain) -> list:
-    try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
-        query = "SELECT id, url, weight FROM urls"
-        params = ()
-        if domain:
-            query += " WHERE domain = %s"
-            params = (domain,)
-        query += " ORDER BY id"
+    Returns:
+        dict: Mapping of id to a (weight, open_count) tuple, for the ids that exist.
+    """
+    stats = {}
+    _ensure_table(db_config, URL_OPEN_DAILY_TABLE)
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        for start in range(0, len(ids), DEFAULT_UPLOAD_BATCH_SIZE):
+            chunk = tuple(ids[start:start + DEFAULT_UPLOAD_BATCH_SIZE])
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(URL_STATS_QUERY.format(placeholders=placeholders), chunk)
+            for url_id, weight, open_count in cursor:
+                stats[url_id] = (weight, open_count)
+    return stats
+
+
+SAMPLE_CLIENT_QUERY = "SELECT id, weight FROM urls"
+SAMPLE_SERVER_QUERY = "SELECT id FROM urls WHERE weight > 0"
+SAMPLE_SERVER_ORDER = " ORDER BY LOG(1 - RAND()) / weight DESC LIMIT %s"
+SAMPLER_WEIGHTS_QUERY = "SELECT id, weight FROM urls WHERE weight > 0"
+
+
+def _sample_client_side(db_config, needed, domain) -> list:
+    # Pull every (id, weight) for the domain and draw in NumPy, then fetch
+    # only the winning URL strings.
+    query = SAMPLE_CLIENT_QUERY
+    params = ()
+    if domain:
+        query += " WHERE domain = %s"
+        params = (domain,)
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
         cursor.execute(query, params)
-        urls_data = cursor.fetchall()
-    finally:
-        if 'conn' in locals() and conn.is_connected():
-            cursor.close()
-            conn.close()
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        ids, weights = zip(*rows)
+        sampled_ids = [ids[i] for i in weighted_sample_indices(weights, needed)]
+        return fetch_urls_by_id(cursor, sampled_ids)
+
+
+def _sample_server_side(db_config, needed, domain) -> list:
+    # Phase 1 lets MySQL compute the exponential key LOG(1 - RAND()) / weight
+    # per row and keep the `needed` largest, sorting ids only. Phase 2 fetches
+    # the URL strings for the winners, so just `needed` rows cross the wire.
+    query = SAMPLE_SERVER_QUERY
+    params = ()
+    if domain:
+        query += " AND domain = %s"
+        params = (domain,)
+    query += SAMPLE_SERVER_ORDER
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(query, params + (int(needed),))
+        sampled_ids = [row[0] for row in cursor.fetchall()]
+        return fetch_urls_by_id(cursor, sampled_ids)
+
+
+class FenwickTree:
+    """
+    Binary indexed tree over non-negative integer weights.
+
+    Supports point updates and finding the item a weighted draw lands on in
+    O(log n), which is what makes repeated draws without replacement cheap.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.int64)
+        self.size = weights.size
+        # Vectorized O(n) build: node i (1-based) holds the sum of the
+        # lowbit(i) weights ending at i.
+        prefix = np.concatenate(([0], np.cumsum(weights)))
+        index = np.arange(1, self.size + 1)
+        self.tree = np.zeros(self.size + 1, dtype=np.int64)
+        self.tree[1:] = prefix[index] - prefix[index - (index & -index)]
+        self._top_bit = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def add(self, i, delta) -> None:
+        """Add delta to the weight of item i (0-based)."""
+        i += 1
+        tree = self.tree
+        while i <= self.size:
+            tree[i] += delta
+            i += i & -i
+
+    def find(self, target) -> int:
+        """
+        Return the 0-based item whose cumulative weight range contains target,
+        i.e. the smallest i with prefix_sum(i) > target, for 0 <= target < total.
+        """
+        pos = 0
+        step = self._top_bit
+        tree = self.tree
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and tree[nxt] <= target:
+                target -= tree[nxt]
+                pos = nxt
+            step >>= 1
+        return pos
+
+
+class DomainSampler:
+    """
+    Compact in-memory sampling index for one domain: NumPy arrays of URL ids and
+    weights plus a Fenwick tree over the weights.
+
+    Each call to sample() draws k ids without replacement in O(k log n), choosing
+    each one with probability weight / remaining weight, the same scheme as
+    weighted_sample_indices().
+    """
+
+    def __init__(self, ids, weights):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.weights = np.clip(np.asarray(weights, dtype=np.int64), 0, None)
+        self.total = int(self.weights.sum())
+        self.tree = FenwickTree(self.weights)
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.weights.nbytes + self.tree.tree.nbytes
+
+    def sample(self, needed, rng=None) -> list:
+        """
+        Draw up to `needed` distinct URL ids.
+
+        Args:
+            needed (int): Number of ids wanted.
+            rng (np.random.Generator, optional): Random generator.
+
+        Returns:
+            list: Sampled URL ids, in draw order.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        picked = []
+        with self._lock:
+            remaining = self.total
+            try:
+                while len(picked) < needed and remaining > 0:
+                    i = self.tree.find(int(rng.integers(remaining)))
+                    picked.append(i)
+                    # Take the item out of the tree so it cannot be drawn again
+                    self.tree.add(i, -int(self.weights[i]))
+                    remaining -= int(self.weights[i])
+            finally:
+                for i in picked:
+                    self.tree.add(i, int(self.weights[i]))
+        return [int(self.ids[i]) for i in picked]
+
+
+SAMPLER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# (pool key, domain) -> DomainSampler, least recently used first
+_sampler_cache = OrderedDict()
+_sampler_generations = {}
+_sampler_cache_lock = threading.Lock()
+_sampler_cache_max_bytes = SAMPLER_CACHE_MAX_BYTES
+
+
+def set_sampler_cache_limit(max_bytes) -> None:
+    """
+    Set the memory cap of the per-domain sampler cache, evicting least recently
+    used domains if it is now exceeded.
+
+    Args:
+        max_bytes (int): Maximum total size of the cached NumPy arrays.
+    """
+    global _sampler_cache_max_bytes
+    with _sampler_cache_lock:
+        _sampler_cache_max_bytes = int(max_bytes)
+        _evict_samplers()
+
 
-    if not urls_data:
+def _evict_samplers() -> None:
+    # Caller holds _sampler_cache_lock. Always keep the most recent entry,
+    # even if it alone is over the cap.
+    used = sum(sampler.nbytes for sampler in _sampler_cache.values())
+    while used > _sampler_cache_max_bytes and len(_sampler_cache) > 1:
+        key, sampler = _sampler_cache.popitem(last=False)
+        used -= sampler.nbytes
+        logging.info(f"Evicted sampling index for domain {key[1]!r}")
+
+
+def get_domain_sampler(db_config, domain) -> DomainSampler:
+    """
+    Return the cached sampling index for a domain, building it from the
+    `urls` table on first use or after invalidation.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        domain (str): Domain to index, or None for all URLs.
+
+    Returns:
+        DomainSampler: The sampling index.
+    """
+    key = (_pool_key(db_config), domain)
+    with _sampler_cache_lock:
+        sampler = _sampler_cache.get(key)
+        if sampler is not None:
+            _sampler_cache.move_to_end(key)
+            return sampler
+        generation = _sampler_generations.get(key, 0)
+
+    query = SAMPLER_WEIGHTS_QUERY
+    params = ()
+    if domain:
+        query += " AND domain = %s"
+        params = (domain,)
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    ids, weights = zip(*rows) if rows else ((), ())
+    sampler = DomainSampler(ids, weights)
+
+    with _sampler_cache_lock:
+        # Don't cache an index that a write invalidated while it was being built
+        if _sampler_generations.get(key, 0) == generation:
+            _sampler_cache[key] = sampler
+            _evict_samplers()
+    return sampler
+
+
+def invalidate_domain_sampler(db_config, domain=None) -> None:
+    """
+    Drop cached sampling indexes after the `urls` table changes.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        domain (str, optional): The domain that changed. The all-domains index is
+            always dropped too. None drops every domain of this database.
+    """
+    pool_key = _pool_key(db_config)
+    with _sampler_cache_lock:
+        keys = {key for key in list(_sampler_cache) + list(_sampler_generations)
+                if key[0] == pool_key and (domain is None or key[1] in (domain, None))}
+        keys.update({(pool_key, domain), (pool_key, None)})
+        for key in keys:
+            _sampler_cache.pop(key, None)
+            _sampler_generations[key] = _sampler_generations.get(key, 0) + 1
+
+
+def _sample_cached(db_config, needed, domain) -> list:
+    sampled_ids = get_domain_sampler(db_config, domain).sample(int(needed))
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        return fetch_urls_by_id(cursor, sampled_ids)
+
+
+SAMPLING_MODES = {
+    'client': _sample_client_side,
+    'server': _sample_server_side,
+    'cached': _sample_cached,
+}
+
+
+def weighted_sample_without_replacement(db_config, needed, domain, mode='server') -> list:
+    """
+    Samples URLs from the database without replacement, according to their weights.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        needed (int): Number of URLs needed. If the domain holds fewer URLs,
+            all of them are returned.
+        domain (str): Domain to sample from, or None for all URLs.
+        mode (str): Where the draw happens. 'server' (default) ranks rows inside
+            MySQL so only the sampled rows are transferred; 'client' fetches all ids
+            and weights for the domain and draws with weighted_sample_indices();
+            'cached' draws from the in-process DomainSampler for the domain, which
+            is kept across calls and only rebuilt after writes to that domain.
+            All three give each draw probability weight / remaining weight.
+
+    Returns:
+        list: List of sampled (id, url) tuples, no URL appearing twice.
+    """
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {mode!r}")
+    if int(needed) <= 0:
         return []
 
-    # Create DataFrame from the fetched data
-    df = pd.DataFrame(urls_data, columns=['id', 'url', 'weight'])
-    df_expanded = expand_df(df)
-    random_rows = df_expanded.sample(n=needed, replace=False)
+    sampled = SAMPLING_MODES[mode](db_config, needed, domain)
+    if len(sampled) < needed:
+        logging.info(
+            f"Requested {needed} URLs but only {len(sampled)} are available.")
+    return sampled
+
+
+_tables_ready = set()
+
+
+def _ensure_table(db_config, ddl) -> None:
+    # Run a CREATE TABLE IF NOT EXISTS once per database and process
+    key = (_pool_key(db_config), ddl)
+    if key in _tables_ready:
+        return
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(ddl)
+    _tables_ready.add(key)
+
+
+INSERT_HISTORY_QUERY = """
+INSERT INTO URL_open_history (URL_id, timestamp, browser_id)
+VALUES (%s, %s, %s)
+"""
+
+# Daily rollup of URL_open_history, kept up to date by the history write path so
+# that reports aggregate one row per URL, browser and day rather than one per launch
+URL_OPEN_DAILY_TABLE = """
+CREATE TABLE IF NOT EXISTS url_open_daily (
+    url_id INT NOT NULL,
+    browser_id INT NOT NULL DEFAULT 0,
+    day DATE NOT NULL,
+    open_count INT NOT NULL,
+    PRIMARY KEY (url_id, browser_id, day),
+    INDEX idx_url_open_daily_day (day, url_id)
+)
+"""
 
-    # Return a list of tuples (id, url)
-    return list(zip(random_rows['id'], random_rows['url']))
+ROLLUP_HISTORY_QUERY = """
+INSERT INTO url_open_daily (url_id, browser_id, day, open_count)
+VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE open_count = open_count + VALUES(open_count)
+"""
 
 
-def expand_df(df):
-    # Create an empty list to store each block of replicated rows
-    replicated_blocks = []
+def _rollup_rows(rows) -> list:
+    """
+    Count (url_id, timestamp, browser_id) history rows per URL, browser and day.
 
-    # Iterate over each row in the DataFrame
-    for index, row in df.iterrows():
-        replicated_block = pd.DataFrame({
-            'id': [row['id']] * row['weight'],  # Replicate the id
-            'url': [row['url']] * row['weight']  # Replicate the url
-        })
-        replicated_blocks.append(replicated_block)
+    Returns:
+        list: (url_id, browser_id, day, open_count) tuples in primary key order,
+        so concurrent writers lock the rollup rows in the same order.
+    """
+    counts = {}
+    for url_id, timestamp, browser_id in rows:
+        key = (url_id, browser_id or 0, timestamp.date())
+        counts[key] = counts.get(key, 0) + 1
+    return [key + (count,) for key, count in sorted(counts.items())]
 
-    # Concatenate all replicated blocks to a single DataFrame
-    expanded_df = pd.concat(replicated_blocks, ignore_index=True)
-    return expanded_df
+
+def _write_history(cursor, rows) -> None:
+    # The raw rows and their rollup go in the caller's transaction together
+    cursor.executemany(INSERT_HISTORY_QUERY, rows)
+    cursor.executemany(ROLLUP_HISTORY_QUERY, _rollup_rows(rows))
 
 
 def insert_url_open_history(url_id, browser_id, db_config) -> None:
     """
-    Inserts a record into the URL_open_history table as a parameterised query.
+    Inserts a record into the URL_open_history table as a parameterised query,
+    and counts it in the url_open_daily rollup.
 
     Args:
     url_id (int): The ID of the URL that was opened.
     browser_id (int): The ID of the browser used to open the URL.
     db_config (dict): A dictionary containing database connection parameters.
     """
-    query = """
-    INSERT INTO URL_open_history (URL_id, timestamp, browser_id)
-    VALUES (%s, %s, %s)
-    """
     timestamp = datetime.now()  # Current date and time
 
     try:
-        # Establish a connection to the database
-        conn = mysql.connect(**db_config)
-
-        # Create a cursor object
-        cursor = conn.cursor()
+        _ensure_table(db_config, URL_OPEN_DAILY_TABLE)
+        # Borrow a pooled connection and execute the INSERT statements
+        with get_connection(db_config) as conn, conn.cursor() as cursor:
+            _write_history(cursor, [(url_id, timestamp, browser_id)])
 
-        # Execute the INSERT statement
-        cursor.execute(query, (url_id, timestamp, browser_id))
-
-        # Commit the transaction
-        conn.commit()
+            # Commit the transaction
+            conn.commit()
 
         logging.info("URL open history record inserted successfully.")
 
     except mysql.Error as e:
         logging.error(f"Error while inserting into URL_open_history: {e}")
 
-    finally:
-        # Close the cursor and connection
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
+def insert_url_open_history_many(rows, db_config) -> None:
+    """
+    Insert several URL_open_history records in one multi-row INSERT and transaction,
+    adding them to the url_open_daily rollup in the same transaction.
+
+    Unlike insert_url_open_history(), errors are raised so the caller can keep the
+    rows and retry.
 
-def execute_query(db_config, query, params):
+    Args:
+        rows (list): (url_id, timestamp, browser_id) tuples.
+        db_config (dict): A dictionary containing database connection parameters.
+
+    Raises:
+        mysql.Error: If the rows could not be written; nothing is committed.
     """
-    Execute a SQL query and return the results.
+    if not rows:
+        return
+    _ensure_table(db_config, URL_OPEN_DAILY_TABLE)
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        _write_history(cursor, rows)
+        conn.commit()
+    logging.info(f"Inserted {len(rows)} URL open history records.")
 
-    :param db_config: Database configuration dictionary.
-    :param query: SQL query string.
-    :param params: Tuple of parameters to be used with the query.
-    :return: List of tuples containing the query results.
+
+BACKFILL_DAYS = 31  # days of history rebuilt per transaction
+
+BACKFILL_ROLLUP_SELECT = (
+    "SELECT URL_id, COALESCE(browser_id, 0), DATE(timestamp), COUNT(*) "
+    "FROM URL_open_history WHERE timestamp >= %s AND timestamp < %s "
+    "GROUP BY URL_id, COALESCE(browser_id, 0), DATE(timestamp)")
+
+
+def backfill_url_open_daily(db_config, batch_days=BACKFILL_DAYS, progress_callback=None) -> int:
     """
+    Rebuild the url_open_daily rollup from URL_open_history.
 
-    print(query)
-    print(params)
+    The history is processed in windows of `batch_days` days. Each window's rollup
+    rows are deleted and recomputed in one transaction, so the job can be re-run or
+    interrupted at any point. INSERT ... SELECT locks the history rows it reads, so
+    a launch recorded meanwhile waits for the window and is then counted once.
 
+    Args:
+        db_config (dict): Database configuration parameters.
+        batch_days (int): Days of history per transaction.
+        progress_callback (callable, optional): Called with (day reached, last day).
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+    _ensure_table(db_config, URL_OPEN_DAILY_TABLE)
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        return backfill_rollup_windows(cursor, conn.commit, batch_days, progress_callback)
+
+
+def backfill_rollup_windows(cursor, commit, batch_days=BACKFILL_DAYS, progress_callback=None) -> int:
+    """
+    The window loop of backfill_url_open_daily(), on a given cursor, calling
+    `commit` after each window; also run as a schema migration.
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+    cursor.execute("SELECT MIN(DATE(timestamp)), MAX(DATE(timestamp)) FROM URL_open_history")
+    first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return 0
+
+    written = 0
+    start = first_day
+    while start <= last_day:
+        end = start + timedelta(days=batch_days)
+        cursor.execute("DELETE FROM url_open_daily WHERE day >= %s AND day < %s", (start, end))
+        cursor.execute(
+            "INSERT INTO url_open_daily (url_id, browser_id, day, open_count) "
+            + BACKFILL_ROLLUP_SELECT, (start, end))
+        written += cursor.rowcount
+        commit()
+        if progress_callback:
+            progress_callback(min(end, last_day), last_day)
+        start = end
+    logging.info(f"Backfilled {written} url_open_daily rows from {first_day} to {last_day}.")
+    return written
+
+
+VPN_ROTATION_TABLE = """
+CREATE TABLE IF NOT EXISTS vpn_rotation_history (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    browser_id INT NOT NULL,
+    server_code VARCHAR(64) NOT NULL,
+    started_at DATETIME NOT NULL,
+    duration_ms INT NOT NULL,
+    success TINYINT(1) NOT NULL,
+    INDEX idx_vpn_rotation_browser_time (browser_id, started_at)
+)
+"""
+
+def insert_vpn_rotation(db_config, browser_id, server_code, started_at, duration_ms, success) -> None:
+    """
+    Record the outcome of one VPN rotation in vpn_rotation_history.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        browser_id (int): The browser the rotation was made for.
+        server_code (str): The server, country or group code connected to.
+        started_at (datetime): When the rotation started.
+        duration_ms (int): How long it took, including retries.
+        success (bool): Whether the VPN ended up connected.
+    """
     try:
-        conn = mysql.connect(**db_config)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        return results
-    except mysql.connector.InterfaceError as e:
-        logging.error(f"Database connection failed: {e}")
-    except mysql.connector.DataError as e:
-        logging.error(f"Data problem: {e}")
-    except mysql.connector.OperationalError as e:
-        logging.error(f"Operational error: {e}")
-    except mysql.connector.IntegrityError as e:
-        logging.error(f"Integrity issue: {e}")
-    except mysql.connector.InternalError as e:
-        logging.error(f"Internal database error: {e}")
-    except mysql.connector.ProgrammingError as e:
-        logging.error(f"Query programming issue: {e}")
-    except mysql.connector.NotSupportedError as e:
-        logging.error(f"Not supported feature: {e}")
-    except Exception as e:  # Catch-all for non-MySQL related errors
-        logging.error(f"An unexpected error occurred: {e}")
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
-    return results
+        _ensure_table(db_config, VPN_ROTATION_TABLE)
+        with get_connection(db_config) as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO vpn_rotation_history (browser_id, server_code, started_at, duration_ms, success) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                (browser_id, server_code, started_at, int(duration_ms), bool(success)))
+            conn.commit()
+    except mysql.Error as e:
+        logging.error(f"Error while inserting into vpn_rotation_history: {e}")
+
+
+VPN_ROTATIONS_QUERY = (
+    "SELECT server_code, duration_ms, success FROM vpn_rotation_history "
+    "WHERE browser_id = %s AND started_at >= %s ORDER BY started_at DESC")
+
+
+def get_vpn_rotations(db_config, browser_id, since) -> list:
+    """
+    Fetch the recent VPN rotations of a browser, newest first.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        browser_id (int): The browser.
+        since (datetime): Oldest rotation to include.
+
+    Returns:
+        list: (server_code, duration_ms, success) tuples.
+    """
+    _ensure_table(db_config, VPN_ROTATION_TABLE)
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(VPN_ROTATIONS_QUERY, (browser_id, since))
+        return cursor.fetchall()
+
+
+HISTORY_PAGE_SIZE = 100
+
+HISTORY_REPORT_MAX_AGE = timedelta(days=1)
+
+# The result of a history query, computed once and then paged by position. Reports
+# live in an ordinary table, not a TEMPORARY one, because every page may be read on
+# a different pooled connection and the pool resets sessions.
+HISTORY_REPORT_TABLE = """
+CREATE TABLE IF NOT EXISTS history_report (
+    position BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    report_id BIGINT NOT NULL,
+    url_id INT NOT NULL,
+    page INT NULL,
+    occurrences BIGINT NOT NULL,
+    created_at DATETIME NOT NULL,
+    INDEX idx_history_report_position (report_id, position),
+    INDEX idx_history_report_created (created_at)
+)
+"""
+
+# The URLs of a domain opened more than once since a date, by page then most opened.
+# URL_id breaks ties so that the order is total. The counts come from the
+# url_open_daily rollup, one row per URL, browser and day. INSERT ... SELECT with
+# ORDER BY hands out the AUTO_INCREMENT positions in that order.
+_HISTORY_REPORT_SELECT = """
+    SELECT
+        %s,
+        url_open_daily.url_id,
+        users_urls.page,
+        SUM(url_open_daily.open_count) AS occurrences,
+        %s
+    FROM
+        url_open_daily
+    JOIN
+        urls
+    ON
+        url_open_daily.url_id = urls.id
+    JOIN
+        users_urls
+    ON
+        urls.id = users_urls.url_id
+    WHERE
+        urls.domain = %s AND url_open_daily.day >= DATE(%s)
+    GROUP BY
+        url_open_daily.url_id, users_urls.page
+    HAVING
+        occurrences > 1
+    ORDER BY
+        users_urls.page ASC, occurrences DESC, url_open_daily.url_id ASC
+"""
+_HISTORY_REPORT_INSERT = ("INSERT INTO history_report (report_id, url_id, page, occurrences, created_at)"
+                          + _HISTORY_REPORT_SELECT)
+
+_HISTORY_PAGE_SELECT = """
+    SELECT
+        history_report.url_id,
+        urls.url,
+        history_report.page,
+        history_report.occurrences,
+        history_report.position
+    FROM
+        history_report
+    JOIN
+        urls
+    ON
+        history_report.url_id = urls.id
+    WHERE
+        history_report.report_id = %s AND history_report.position > %s
+    ORDER BY
+        history_report.position
+    LIMIT %s
+"""
+
+
+def create_history_report(db_config, domain, from_date) -> tuple:
+    """
+    Run the URL opening history query once, storing its result for paging.
+
+    The aggregation over the date range is done here, once; each page is then a
+    range read of the stored report by get_history_page(). Opens are counted from
+    the url_open_daily rollup, so the date has day granularity. Reports older than
+    HISTORY_REPORT_MAX_AGE, e.g. left behind by a crash, are removed first.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        domain (str): Domain of the URLs.
+        from_date (str or datetime): Only count opens since this date.
+
+    Returns:
+        tuple: (report_id, number of rows in the report).
+    """
+    _ensure_table(db_config, URL_OPEN_DAILY_TABLE)
+    _ensure_table(db_config, HISTORY_REPORT_TABLE)
+    report_id = random.getrandbits(62)
+    now = datetime.now()
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM history_report WHERE created_at < %s", (now - HISTORY_REPORT_MAX_AGE,))
+        cursor.execute(_HISTORY_REPORT_INSERT, (report_id, now, domain, from_date))
+        total = cursor.rowcount
+        conn.commit()
+    return report_id, total
+
+
+def get_history_page(db_config, report_id, page_size=HISTORY_PAGE_SIZE, after=0) -> tuple:
+    """
+    Fetch one page of a report made by create_history_report().
+
+    Each page continues from the position of the previous page's last row instead
+    of using OFFSET, so every page costs the same index range read of `page_size`
+    rows however far into the report it is.
+
+    Args:
+        db_config (dict): Database configuration parameters.
+        report_id (int): The report.
+        page_size (int): Maximum number of rows to return.
+        after (int): Position returned with the previous page; 0 for the first page.
+
+    Returns:
+        tuple: (rows, position) where rows are (url_id, url, page, occurrences)
+        tuples and position is that of the last row, to pass as `after` for the
+        next page.
+    """
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute(_HISTORY_PAGE_SELECT, (report_id, after, page_size))
+        rows = cursor.fetchall()
+    return [row[:4] for row in rows], rows[-1][4] if rows else after
+
+
+def drop_history_report(db_config, report_id) -> None:
+    """
+    Remove a report that is no longer being paged.
+    """
+    with get_connection(db_config) as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM history_report WHERE report_id = %s", (report_id,))
+        conn.commit()
+
+
+# The queries run for every sample, load, launch or report, each with representative
+# parameters. `python migrations.py check` EXPLAINs them and fails if any scans a
+# whole table, so keep this in step with the functions above.
+HOT_QUERIES = {
+    'domain_patterns': ("SELECT pattern, domain FROM domains", ()),
+    'browsers': ("SELECT id, name, vpn_code, command FROM browsers", ()),
+    'urls_of_domain': ("SELECT url FROM urls WHERE domain = %s", ('example',)),
+    'sample_client_side': (SAMPLE_CLIENT_QUERY + " WHERE domain = %s", ('example',)),
+    'sample_server_side': (SAMPLE_SERVER_QUERY + " AND domain = %s" + SAMPLE_SERVER_ORDER, ('example', 10)),
+    'sampler_weights': (SAMPLER_WEIGHTS_QUERY + " AND domain = %s", ('example',)),
+    'urls_by_id': ("SELECT id, url FROM urls WHERE id IN (%s, %s)", (1, 2)),
+    'url_stats': (URL_STATS_QUERY.format(placeholders="%s, %s"), (1, 2)),
+    'history_report': (_HISTORY_REPORT_SELECT, (1, '2024-01-01', 'example', '2024-01-01')),
+    'history_page': (_HISTORY_PAGE_SELECT, (1, 100, HISTORY_PAGE_SIZE)),
+    'history_backfill': (BACKFILL_ROLLUP_SELECT, ('2024-01-01', '2024-02-01')),
+    'vpn_rotations': (VPN_ROTATIONS_QUERY, (1, '2024-01-01')),
+}
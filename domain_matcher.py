@@ -0,0 +1,107 @@
+# domain_matcher.py
+from collections import deque
+from typing import Iterable, List, Optional, Tuple
+
+"""
+Multi-pattern matcher that maps URLs to domain codes using the `domains.pattern`
+strings, without a database round trip per URL.
+
+The patterns are compiled into an Aho-Corasick automaton, so every pattern is looked
+for in a single pass over the URL whatever the number of patterns.
+
+"""
+
+
+class DomainMatcher:
+    """
+    Aho-Corasick automaton over (pattern, domain) pairs.
+
+    Matching follows the SQL it replaces, `url LIKE CONCAT('%', pattern, '%')`:
+    patterns are plain substrings, compared case-insensitively as under MySQL's
+    default collation. When several patterns occur in a URL, the one listed first
+    wins, like the first row found by the LIMIT 1 query.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        self.domains: List[str] = []
+        # State 0 is the root. goto[s] maps a character to the next state,
+        # fail[s] is the longest proper suffix state, and out[s] the lowest
+        # pattern index ending at s or at any of its suffix states (or None).
+        self.goto: List[dict] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Optional[int]] = [None]
+
+        for pattern, domain in patterns:
+            if not pattern:
+                continue
+            self._add(pattern.lower(), len(self.domains))
+            self.domains.append(domain)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, index: int) -> None:
+        state = 0
+        for char in pattern:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(None)
+            state = nxt
+        if self.out[state] is None:
+            self.out[state] = index
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                # Merge the suffix's best output so each state needs one lookup
+                inherited = self.out[self.fail[nxt]]
+                if inherited is not None and (self.out[nxt] is None or inherited < self.out[nxt]):
+                    self.out[nxt] = inherited
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    def match(self, url: str) -> Optional[str]:
+        """
+        Return the domain of the first listed pattern that occurs in the URL.
+
+        Args:
+            url (str): The URL to classify.
+
+        Returns:
+            str: The domain code, or None if no pattern occurs in the URL.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        best = None
+        for char in url.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = out[state]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return self.domains[best] if best is not None else None
+
+    def match_many(self, urls: Iterable[str]) -> List[Optional[str]]:
+        """
+        Classify a batch of URLs.
+
+        Args:
+            urls (iterable): URLs to classify.
+
+        Returns:
+            list: The domain code for each URL, None where no pattern matched.
+        """
+        return [self.match(url) for url in urls]
@@ -2,20 +2,33 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, PhotoImage
 from tkinter.scrolledtext import ScrolledText
-import csv
 import db
 import re
 import random
 import vpn_manager as vpn
-import threading
+import vpn_async
+import vpn_selection
 import logging
-import mysql.connector as mysql
 import gui_open_history_popup
+import history_writer
+import url_search
+import lookup_snapshot
+from weight_rules import WeightRules
+from gui_worker import TkWorker
+from url_table import URLTable
 from functools import partial
-from typing import List, Tuple, Union, Dict
+from typing import List, Optional, Dict
 # import time
 # import subprocess
-from utils import open_urls
+from utils import open_urls, RotationPolicy
+from session_runner import SessionRunner, split_round_robin
+from lazy import lazy_import
+
+mysql = lazy_import("mysql.connector")
+asyncio = lazy_import("asyncio")
+
+LOADING = "Loading..."
+LOOKUP_RETRY_MS = 30000  # how often to retry the database while in read-only mode
 
 
 class URLManagerGUI(tk.Tk):
@@ -41,6 +54,23 @@ class URLManagerGUI(tk.Tk):
         self.db_config = config['db_config']
         gui_config = config['gui_config']
         self.sleep_params = config['main_config']['sleep_params']
+        self.browser_sleep_params = config['main_config'].get('browser_sleep_params', {})
+        # Optional VPN rotation during the sleep windows, e.g. {every_urls: 5, every_minutes: 30}
+        rotation = config['main_config'].get('rotation')
+        self.rotation_policy = RotationPolicy(**rotation) if rotation else None
+        self.sampling_mode = config['main_config'].get('sampling_mode', 'cached')
+        # Built on first use, so numpy is not imported before the window is drawn
+        self._config = config
+        self._weight_rules = None
+        # Start the write-behind history writer with its configured batch limits
+        history_writer.get_history_writer(
+            self.db_config, **config['main_config'].get('history_writer', {}))
+        self.upload_batch_size = config['main_config'].get(
+            'upload_batch_size', db.DEFAULT_UPLOAD_BATCH_SIZE)
+        self.use_load_data = config['main_config'].get('use_load_data', False)
+        if 'sampler_cache_mb' in config['main_config']:
+            db.set_sampler_cache_limit(
+                config['main_config']['sampler_cache_mb'] * 1024 * 1024)
 
         icon_file = config['main_config']['main_path'] + \
             config['gui_config']['mu_icon']
@@ -48,35 +78,160 @@ class URLManagerGUI(tk.Tk):
         icon = PhotoImage(file=icon_file)
         self.iconphoto(True, icon)
 
-        # Load browser configurations from the database
-        self.browsers = db.get_browsers(self.db_config)
+        # Browsers and domains are fetched in the background once the window is up;
+        # until then the UI is built from the local snapshot of the last run, if any
+        self.browsers = {}
+        self.selected_browser = None
+        self.domain_options = []
+        self.default_domain = None
+        self.read_only = False
+        self.lookup_snapshot_file = config['main_config'].get('main_path', './') + \
+            config['main_config'].get('lookup_snapshot_file', lookup_snapshot.DEFAULT_SNAPSHOT_FILE)
+        snapshot = lookup_snapshot.load_snapshot(self.lookup_snapshot_file)
 
         # Initialize ttk styles
         self.style = ttk.Style(self)
         self.style.theme_use('default')
 
-        # Select a default browser
-        self.selected_browser = next(
-            iter(self.browsers)) if self.browsers else None
-
-        # Load domains from the database
-        domain_options, default_domain = db.get_domains(self.db_config)
-
-        # Setup the domain dropdown
+        # Setup the domain dropdown, with a placeholder until the domains arrive
         self.domain_var = tk.StringVar(self)
-        self.domain_var.set(default_domain)
+        self.domain_var.set(LOADING)
         self.optionmenu_domain = tk.OptionMenu(
-            self, self.domain_var, *domain_options)
+            self, self.domain_var, LOADING)
         self.optionmenu_domain.pack(pady=(0, 10))
+        self.label_read_only = tk.Label(self, text="", fg="red")
+        self.label_read_only.pack()
+
+        # Database and VPN calls run on this worker pool; results come back via after()
+        self.worker = TkWorker(self, on_busy=self.show_busy)
 
         self.setup_file_selection()
         self.setup_url_entry()
         self.setup_export_to_csv()
         self.setup_vpn_controls()
         self.setup_url_loading()
+        self.setup_session_controls()
+        self.setup_url_search()
+        self.setup_busy_indicator()
+
+        # The VPN monitor polls nordvpn in the background; its change callbacks
+        # are handed to the Tk main loop through the worker's queue.
+        self.vpn_monitor = vpn.get_monitor(config['main_config'].get('vpn_poll_interval'))
+        self.vpn_monitor.add_listener(
+            lambda snapshot: self.worker.post(self.update_vpn_status_display))
 
         # Update the display to show the VPN status and the selected browser
+        self.vpn_server_stats = {}
+        if snapshot:
+            self.selected_browser = snapshot.get('selected_browser')
+            self.set_browsers(snapshot['browsers'])
+            if snapshot.get('selected_domain') in snapshot['domains']:
+                self.domain_var.set(snapshot['selected_domain'])
+            self.set_domains(snapshot['domains'], snapshot.get('default_domain'))
         self.update_vpn_status_display()
+        self.domain_var.trace_add('write', lambda *args: self.save_lookup_snapshot())
+
+        # Refresh the lookups concurrently; the dropdowns change only if the data did
+        self.load_lookups()
+
+    @property
+    def weight_rules(self) -> WeightRules:
+        if self._weight_rules is None:
+            self._weight_rules = WeightRules.from_config(self._config)
+        return self._weight_rules
+
+    def load_lookups(self) -> None:
+        """
+        Fetch the browsers and the domains from the database, in parallel.
+        """
+        self.worker.submit("browsers", db.get_browsers, self.db_config,
+                           on_success=self.on_browsers_loaded, on_error=self.on_lookup_error)
+        self.worker.submit("domains", db.get_domains, self.db_config,
+                           on_success=lambda result: self.on_domains_loaded(*result),
+                           on_error=self.on_lookup_error)
+
+    def on_browsers_loaded(self, browsers: Dict) -> None:
+        self.set_read_only(False)
+        if browsers != self.browsers:
+            self.set_browsers(browsers)
+            self.save_lookup_snapshot()
+
+    def on_domains_loaded(self, domain_options: List[str], default_domain: str) -> None:
+        self.set_read_only(False)
+        if domain_options != self.domain_options or default_domain != self.default_domain:
+            self.set_domains(domain_options, default_domain)
+            self.save_lookup_snapshot()
+
+    def on_lookup_error(self, error: Exception) -> None:
+        if isinstance(error, mysql.Error):
+            # Unreachable: keep working from the snapshot, without writing to the database
+            logging.error(f"Database unavailable, running read-only: {error!r}")
+            self.set_read_only(True)
+        else:
+            self.show_db_error("Loading Lookups Failed", error)
+
+    def set_read_only(self, read_only: bool) -> None:
+        """
+        Enter or leave read-only mode, in which the actions that write URLs are
+        disabled and the lookups are retried every LOOKUP_RETRY_MS.
+        """
+        if read_only == self.read_only:
+            return
+        self.read_only = read_only
+        state = 'disabled' if read_only else 'normal'
+        for button in (self.button_upload, self.button_upload_single, self.button_clear):
+            button.config(state=state)
+        if read_only:
+            self.label_read_only.config(text="Database unreachable - read-only mode, retrying...")
+            self.after(LOOKUP_RETRY_MS, self.retry_lookups)
+        else:
+            self.label_read_only.config(text="")
+            logging.info("Database reachable again, leaving read-only mode.")
+
+    def retry_lookups(self) -> None:
+        if self.read_only:
+            self.load_lookups()
+            self.after(LOOKUP_RETRY_MS, self.retry_lookups)
+
+    def save_lookup_snapshot(self) -> None:
+        """
+        Save the lookups and the current selections for the next start.
+        """
+        if not (self.browsers or self.domain_options):
+            return  # nothing loaded yet
+        selected_domain = self.domain_var.get()
+        lookup_snapshot.save_snapshot(
+            self.lookup_snapshot_file, self.browsers, self.domain_options, self.default_domain,
+            selected_domain if selected_domain in self.domain_options else None,
+            self.selected_browser)
+
+    def set_browsers(self, browsers: Dict) -> None:
+        """
+        Fill the browser dropdown, keeping the current selection if it still exists.
+        """
+        self.browsers = browsers
+        self.browsers_combo.config(values=list(self.browsers.keys()))
+        if self.selected_browser not in self.browsers:
+            # Select a default browser
+            self.selected_browser = next(
+                iter(self.browsers)) if self.browsers else None
+        self.browser_var.set(self.selected_browser or "")
+        self.vpn_server_stats = {}
+        self.update_vpn_status_display()
+        self.refresh_vpn_server_stats()
+
+    def set_domains(self, domain_options: List[str], default_domain: str = None) -> None:
+        """
+        Fill the domain dropdown, keeping the current selection if it still exists.
+        """
+        self.domain_options = list(domain_options)
+        self.default_domain = default_domain
+        menu = self.optionmenu_domain['menu']
+        menu.delete(0, 'end')
+        for domain in domain_options:
+            menu.add_command(label=domain, command=tk._setit(self.domain_var, domain))
+        if self.domain_var.get() not in domain_options:
+            self.domain_var.set(default_domain or (domain_options[0] if domain_options else ""))
 
     def get_browsers(self) -> list:
         # getter function for browsers
@@ -86,6 +241,10 @@ class URLManagerGUI(tk.Tk):
         # getter function for sleep parameters
         return self.sleep_params
 
+    def get_rotation_policy(self):
+        # getter function for the VPN rotation policy (None if not configured)
+        return self.rotation_policy
+
     def setup_file_selection(self) -> None:
         # File Selection
         self.label_file = tk.Label(self, text="No file selected")
@@ -93,9 +252,18 @@ class URLManagerGUI(tk.Tk):
         self.button_select_file = tk.Button(
             self, text="Select File", command=self.select_file)
         self.button_select_file.pack()
+        self.infer_upload_domains = tk.BooleanVar(self, value=False)
+        tk.Checkbutton(self, text="Infer domain of each URL",
+                       variable=self.infer_upload_domains).pack()
         self.button_upload = tk.Button(
             self, text="Upload URLs", command=self.bulk_upload)
         self.button_upload.pack(pady=(10, 0))
+        self.button_cancel_upload = tk.Button(
+            self, text="Cancel Upload", command=self.cancel_upload, state='disabled')
+        self.button_cancel_upload.pack()
+        self.label_upload_progress = tk.Label(self, text="")
+        self.label_upload_progress.pack()
+        self.upload_task = None
 
     def setup_url_entry(self) -> None:
         # Frame for URL and Weight (side-by-side)
@@ -132,9 +300,24 @@ class URLManagerGUI(tk.Tk):
         self.label_filename.pack(pady=(10, 0))
         self.entry_filename = tk.Entry(self)
         self.entry_filename.pack(pady=(0, 10))
+
+        # Columns to export, and whether to gzip the file
+        export_options_frame = tk.Frame(self)
+        export_options_frame.pack()
+        self.export_column_vars = {}
+        for column in db.EXPORT_COLUMNS:
+            self.export_column_vars[column] = tk.BooleanVar(value=(column == 'url'))
+            tk.Checkbutton(export_options_frame, text=column.replace('_', ' ').capitalize(),
+                           variable=self.export_column_vars[column]).pack(side=tk.LEFT)
+        self.export_gzip = tk.BooleanVar(value=False)
+        tk.Checkbutton(export_options_frame, text="gzip",
+                       variable=self.export_gzip).pack(side=tk.LEFT, padx=(10, 0))
+
         self.button_export_csv = tk.Button(
             self, text="Export to CSV", command=self.export_to_csv)
         self.button_export_csv.pack(pady=(10, 0))
+        self.label_export_progress = tk.Label(self, text="")
+        self.label_export_progress.pack()
 
     def setup_vpn_controls(self) -> None:
         # VPN/Browser-related widgets in a frame
@@ -160,7 +343,7 @@ class URLManagerGUI(tk.Tk):
 
         # Check VPN Status Button
         button_check_vpn = tk.Button(
-            top_frame, text="Check VPN Status", command=self.update_vpn_status_display)
+            top_frame, text="Check VPN Status", command=self.check_vpn_status)
         button_check_vpn.pack(side=tk.LEFT, padx=(0, 10))
 
         # Frame for the Combobox with a border
@@ -236,10 +419,172 @@ class URLManagerGUI(tk.Tk):
             url_frame, text="Open URLs", command=self.execute_open_urls)
         button_open_urls.pack(side=tk.LEFT, padx=(10, 10))
 
-        # Display area for URLs
-        self.text_display_urls = ScrolledText(
-            self, wrap=tk.WORD, width=100, height=15, state='disabled')
-        self.text_display_urls.pack(pady=(10, 0))
+        button_open_all = tk.Button(
+            url_frame, text="Open in All Browsers", command=self.execute_open_urls_all_browsers)
+        button_open_all.pack(side=tk.LEFT, padx=(0, 10))
+
+        # Display area for URLs: a virtualized table, sorted by ID until a heading is clicked
+        self.table_urls = URLTable(self, height=15)
+        self.table_urls.pack(pady=(10, 0), fill=tk.X)
+        self.table_urls.sort_by('id', descending=False)
+
+    def setup_session_controls(self) -> None:
+        # Controls for the running URL-opening sessions
+        self.sessions = []
+
+        session_frame = tk.Frame(self)
+        session_frame.pack(pady=(10, 0))
+
+        tk.Button(session_frame, text="Pause", command=self.pause_sessions).pack(side=tk.LEFT)
+        tk.Button(session_frame, text="Resume", command=self.resume_sessions).pack(side=tk.LEFT, padx=(5, 0))
+        tk.Button(session_frame, text="Cancel", command=self.cancel_sessions).pack(side=tk.LEFT, padx=(5, 20))
+
+        tk.Label(session_frame, text="Sleep (s) min:").pack(side=tk.LEFT)
+        self.entry_sleep_min = tk.Entry(session_frame, width=5)
+        self.entry_sleep_min.insert(0, str(self.sleep_params[0]))
+        self.entry_sleep_min.pack(side=tk.LEFT, padx=(5, 5))
+        tk.Label(session_frame, text="max:").pack(side=tk.LEFT)
+        self.entry_sleep_max = tk.Entry(session_frame, width=5)
+        self.entry_sleep_max.insert(0, str(self.sleep_params[1]))
+        self.entry_sleep_max.pack(side=tk.LEFT, padx=(5, 5))
+        tk.Button(session_frame, text="Apply", command=self.apply_sleep_params).pack(side=tk.LEFT)
+
+    def active_sessions(self) -> list:
+        # Forget finished sessions as we go
+        self.sessions = [session for session in self.sessions if not session.done]
+        return self.sessions
+
+    def pause_sessions(self) -> None:
+        for session in self.active_sessions():
+            session.pause()
+
+    def resume_sessions(self) -> None:
+        for session in self.active_sessions():
+            session.resume()
+
+    def cancel_sessions(self) -> None:
+        for session in self.active_sessions():
+            session.cancel()
+
+    def apply_sleep_params(self) -> None:
+        """
+        Use the entered sleep range for new sessions and for those already running.
+        """
+        try:
+            sleep_min = int(self.entry_sleep_min.get())
+            sleep_max = int(self.entry_sleep_max.get())
+        except ValueError:
+            messagebox.showerror("Error", "Sleep times must be whole numbers of seconds.")
+            return
+        if not 0 <= sleep_min <= sleep_max:
+            messagebox.showerror("Error", "Sleep min must be between 0 and max.")
+            return
+        self.sleep_params = (sleep_min, sleep_max)
+        for session in self.active_sessions():
+            session.set_sleep_params(self.sleep_params)
+
+    def setup_url_search(self) -> None:
+        # Search box over all stored URLs, with paging and an optional domain filter
+        self.search_index = url_search.URLSearchIndex(self.db_config)
+        self.search_page = 0
+
+        search_frame = tk.Frame(self)
+        search_frame.pack(pady=(10, 0))
+
+        tk.Label(search_frame, text="Search URLs:").pack(side=tk.LEFT)
+        self.entry_search = tk.Entry(search_frame, width=40)
+        self.entry_search.pack(side=tk.LEFT, padx=(5, 10))
+        self.entry_search.bind("<Return>", lambda event: self.search_urls())
+
+        self.search_this_domain = tk.BooleanVar(self, value=True)
+        tk.Checkbutton(search_frame, text="Selected domain only",
+                       variable=self.search_this_domain).pack(side=tk.LEFT)
+
+        tk.Button(search_frame, text="Search", command=self.search_urls).pack(
+            side=tk.LEFT, padx=(10, 0))
+        tk.Button(search_frame, text="< Prev",
+                  command=lambda: self.show_search_page(self.search_page - 1)).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Button(search_frame, text="Next >",
+                  command=lambda: self.show_search_page(self.search_page + 1)).pack(side=tk.LEFT)
+        self.label_search_status = tk.Label(search_frame, text="")
+        self.label_search_status.pack(side=tk.LEFT, padx=(10, 0))
+
+        self.text_search_results = ScrolledText(
+            self, wrap=tk.NONE, width=100, height=8, state='disabled')
+        self.text_search_results.pack(pady=(5, 0))
+
+    def setup_busy_indicator(self) -> None:
+        # Shows what is running in the background, with a button to cancel it
+        busy_frame = tk.Frame(self)
+        busy_frame.pack(pady=(10, 0))
+        self.progress_busy = ttk.Progressbar(busy_frame, mode='indeterminate', length=120)
+        self.progress_busy.pack(side=tk.LEFT)
+        self.label_busy = tk.Label(busy_frame, text="Ready")
+        self.label_busy.pack(side=tk.LEFT, padx=(10, 10))
+        self.button_cancel_tasks = tk.Button(
+            busy_frame, text="Cancel", command=self.worker.cancel_all, state='disabled')
+        self.button_cancel_tasks.pack(side=tk.LEFT)
+
+    def show_busy(self, descriptions: List[str]) -> None:
+        """
+        Update the busy indicator with the running background tasks.
+        """
+        if descriptions:
+            self.label_busy.config(text="Working: " + ", ".join(descriptions))
+            self.progress_busy.start(15)
+            self.button_cancel_tasks.config(state='normal')
+            self.config(cursor='watch')
+        else:
+            self.label_busy.config(text="Ready")
+            self.progress_busy.stop()
+            self.button_cancel_tasks.config(state='disabled')
+            self.config(cursor='')
+
+    def show_db_error(self, title: str, error: Exception) -> None:
+        """
+        Report an exception raised by a background database task.
+        """
+        logging.error(f"{title}: {error!r}")
+        if isinstance(error, mysql.InterfaceError):
+            messagebox.showerror(title, f"A connection error occurred: {error}")
+        elif isinstance(error, mysql.Error):
+            messagebox.showerror(title, f"A database error occurred: {error}")
+        else:
+            messagebox.showerror(title, f"An error occurred: {error}")
+
+    def search_urls(self) -> None:
+        """
+        Run a new substring search from the first page.
+        """
+        self.show_search_page(0)
+
+    def show_search_page(self, page: int) -> None:
+        """
+        Display one page of results for the current search text.
+        """
+        query = self.entry_search.get().strip()
+        if not query or page < 0:
+            return
+        domain = self.domain_var.get() if self.search_this_domain.get() else None
+        page_size = url_search.DEFAULT_PAGE_SIZE
+
+        def on_success(result):
+            rows, total = result
+            if page > 0 and not rows:
+                return  # already on the last page
+            self.search_page = page
+
+            first = page * page_size + 1 if rows else 0
+            self.label_search_status.config(text=f"{first}-{page * page_size + len(rows)} of {total}")
+            self.text_search_results.config(state='normal')
+            self.text_search_results.delete('1.0', tk.END)
+            self.text_search_results.insert(
+                tk.END, "".join(f"{url_id}\t{url_domain}\t{url}\n" for url_id, url, url_domain in rows))
+            self.text_search_results.config(state='disabled')
+
+        # The first search builds the index from the database
+        self.worker.submit("search", self.search_index.search, query, domain, page, page_size,
+                           on_success=on_success, on_error=partial(self.show_db_error, "Search Failed"))
 
     def setup_url_loading_old(self) -> None:
         # Frame for URL loading and browser selection
@@ -269,24 +614,88 @@ class URLManagerGUI(tk.Tk):
         Open a file dialog to select a file, and update the label to show the selected file's name.
         """
         self.selected_file = filedialog.askopenfilename(
-            title="Select a file", filetypes=(("Text files", "*.txt"), ("All files", "*.*")))
+            title="Select a file", filetypes=(("Text files", "*.txt"), ("Compressed text files", "*.gz"), ("All files", "*.*")))
         if self.selected_file:
             self.label_file.config(
                 text=f"Selected File: {self.selected_file.split('/')[-1]}")
 
     def bulk_upload(self) -> None:
         """
-        Upload multiple URLs from the selected file to the database, under the selected domain.
+        Upload multiple URLs from the selected file to the database, under the selected domain,
+        or under the domain inferred from each URL if that option is ticked.
+
+        The upload runs on the background worker, which hands its progress reports
+        to the Tk main loop. An interrupted upload of the same file resumes
+        from its last checkpoint.
         """
-        domain = self.domain_var.get()
-        if self.selected_file and domain:
-            count = db.upload_urls_from_file(
-                self.db_config, self.selected_file, domain)
-            messagebox.showinfo("Upload Complete",
-                                f"{count} URLs have been uploaded.")
-        else:
+        infer_domains = self.infer_upload_domains.get()
+        domain = None if infer_domains else self.domain_var.get()
+        selected_file = getattr(self, 'selected_file', None)
+        if not (selected_file and (domain or infer_domains)):
             messagebox.showwarning("Missing Information",
                                    "Please select a file and enter a domain.")
+            return
+        if self.upload_task and not self.upload_task.done:
+            messagebox.showwarning("Upload Running",
+                                   "Please wait for the current upload to finish.")
+            return
+
+        def run_upload(task):
+            return db.upload_urls_from_file(
+                self.db_config, selected_file, domain, weight_rules=self.weight_rules,
+                batch_size=self.upload_batch_size, use_load_data=self.use_load_data,
+                progress_callback=lambda progress: self.worker.post(self.show_upload_progress, progress),
+                cancel_event=task.cancel_event)
+
+        def on_error(error):
+            self.upload_finished()
+            self.label_upload_progress.config(text="Upload failed.")
+            self.show_db_error("Upload Failed", error)
+
+        self.button_upload.config(state='disabled')
+        self.button_cancel_upload.config(state='normal')
+        self.label_upload_progress.config(text="Uploading...")
+        self.upload_task = self.worker.submit(
+            "upload", run_upload, pass_task=True, on_success=self.show_upload_result,
+            on_cancel=self.show_upload_result, on_error=on_error)
+
+    def show_upload_progress(self, progress: dict) -> None:
+        """
+        Show a progress report from the running upload.
+        """
+        percent = 100 * progress['bytes_read'] / max(progress['total_bytes'], 1)
+        self.label_upload_progress.config(
+            text=f"{percent:.0f}% - line {progress['lines']}: "
+                 f"{progress['inserted']} new, {progress['duplicate']} duplicate, "
+                 f"{progress['rejected']} rejected")
+
+    def upload_finished(self) -> None:
+        self.button_upload.config(state='disabled' if self.read_only else 'normal')
+        self.button_cancel_upload.config(state='disabled')
+
+    def show_upload_result(self, counts: Optional[dict]) -> None:
+        """
+        Report the counts of a finished or cancelled upload (None if it never started).
+        """
+        self.upload_finished()
+        if counts is None:
+            self.label_upload_progress.config(text="Upload Cancelled")
+            return
+        self.search_index.invalidate()
+        title = "Upload Complete" if counts['completed'] else "Upload Cancelled"
+        self.label_upload_progress.config(text=title)
+        messagebox.showinfo(title,
+                            f"{counts['inserted']} URLs have been uploaded.\n"
+                            f"{counts['duplicate']} were already present.\n"
+                            f"{counts['rejected']} lines were rejected.")
+
+    def cancel_upload(self) -> None:
+        """
+        Stop the running upload after its current batch. Uploading the same file again resumes it.
+        """
+        if self.upload_task and not self.upload_task.done:
+            self.upload_task.cancel()
+            self.label_upload_progress.config(text="Cancelling...")
 
     def infer_domain(self, url: str) -> str:
         domain = db.get_domain_from_url(url, self.db_config)
@@ -294,56 +703,42 @@ class URLManagerGUI(tk.Tk):
             raise ValueError("Domain pattern not recognized in URL.")
         return domain
 
-    def infer_weight(self, url: str) -> int:
+    def infer_weight(self, url: str, domain: str = None) -> int:
         """
-        Infer the weight based on the page number in the URL.
-        Raises an error if 'page=' is not found.
+        Infer the weight based on the page number in the URL, using the
+        weight_rules thresholds from config.yml for the URL's domain.
+        Raises an error if the page number is not found.
         """
-        # Use regex to find the page number after 'page=' in the URL
-        page_match = re.search(r'page=(\d+)', url)
-        if not page_match:
-            raise ValueError("The URL is missing 'page=' parameter.")
-
-        # Convert the matched page number to an integer
-        page_number = int(page_match.group(1))
-
-        # Determine weight based on page number
-        if page_number <= 10:
-            return 1
-        elif page_number <= 20:
-            return 2
-        elif page_number <= 50:
-            return 3
-        elif page_number <= 100:
-            return 4
-        else:
-            return 5
+        return self.weight_rules.infer(url, domain)
 
     def upload_single_url(self) -> None:
 
         url = self.entry_url.get().strip()
-        domain = self.infer_domain(url)
 
-        if not domain:
-            messagebox.showwarning(
-                "Domain Not Recognised", "The URL does not match any recognised domain.")
-            return
-
-        try:
+        def upload():
+            domain = self.infer_domain(url)
             # Infer weight based on page number
-            weight = self.infer_weight(url)
-
+            weight = self.infer_weight(url, domain)
             # Insert URL with inferred domain and weight into the database
             db.insert_url(self.db_config, url, domain, weight)
+            return domain, weight
+
+        def on_success(result):
+            domain, weight = result
+            self.search_index.invalidate()
             messagebox.showinfo(
                 "Upload Successful", f"URL '{url}' has been uploaded to domain '{domain}' with weight {weight}.")
             # Clear the entry after successful upload
             self.entry_url.delete(0, tk.END)
-        except ValueError as e:
-            # Display error if 'page=' is missing
-            messagebox.showwarning("Invalid URL", str(e))
-        except mysql.Error as e:
-            messagebox.showerror("Upload Failed", f"An error occurred: {e}")
+
+        def on_error(error):
+            if isinstance(error, ValueError):
+                # Unrecognised domain, or 'page=' is missing
+                messagebox.showwarning("Invalid URL", str(error))
+            else:
+                self.show_db_error("Upload Failed", error)
+
+        self.worker.submit("upload URL", upload, on_success=on_success, on_error=on_error)
 
     def clear_urls(self) -> None:
         """
@@ -354,58 +749,88 @@ class URLManagerGUI(tk.Tk):
             "Confirm Clear", "This will remove all URLs from the database. This cannot be undone. Do you want to proceed?")
         if not confirmation:  # If the user does not confirm, exit the method
             return
-        try:
-            # Attempt to clear all URLs from the database
-            db.clear_all_urls(self.db_config)
+
+        def on_success(_):
+            self.search_index.invalidate()
             messagebox.showinfo(
                 "Clear URLs", "All URLs have been deleted from the database.")
-        except mysql.IntegrityError as ie:
-            messagebox.showerror(
-                "Integrity Error", f"An integrity error occurred: {ie}")
-        except mysql.DataError as de:
-            messagebox.showerror("Data Error", f"A data error occurred: {de}")
-        except mysql.DatabaseError as dbe:
-            messagebox.showerror(
-                "Database Error", f"A database error occurred: {dbe}")
-        except mysql.InterfaceError as ife:
-            messagebox.showerror(
-                "Interface Error", f"A connection error occurred: {ife}")
-        except mysql.Error as e:  # Catch-all for any other MySQL-related errors
-            messagebox.showerror(
-                "Database Error", f"An error occurred while trying to clear URLs: {e}")
-        finally:
-            pass
+
+        def on_error(error):
+            if isinstance(error, mysql.IntegrityError):
+                messagebox.showerror(
+                    "Integrity Error", f"An integrity error occurred: {error}")
+            elif isinstance(error, mysql.DataError):
+                messagebox.showerror("Data Error", f"A data error occurred: {error}")
+            else:
+                self.show_db_error("Clear URLs Failed", error)
+
+        # Attempt to clear all URLs from the database
+        self.worker.submit("clear URLs", db.clear_all_urls, self.db_config,
+                           on_success=on_success, on_error=on_error)
 
     def export_to_csv(self) -> None:
         """
         Export URLs from the database, filtered by the selected domain, to a CSV file.
+
+        The rows are streamed from the database to the file on the background
+        worker, in chunks, with progress shown under the button.
         """
         domain = self.domain_var.get()
+        columns = [column for column, var in self.export_column_vars.items() if var.get()]
+        if not columns:
+            messagebox.showwarning("No Columns", "Please select at least one column to export.")
+            return
+        compress = self.export_gzip.get()
         filename = self.entry_filename.get().strip()
         if not filename:
             filename = "urls.csv"  # Default filename
-        elif not filename.endswith('.csv'):
+        elif not filename.endswith(('.csv', '.csv.gz')):
             filename += '.csv'
+        if compress and not filename.endswith('.gz'):
+            filename += '.gz'
 
-        # Fetch URLs from the database for the selected domain
-        urls = db.get_all_urls(self.db_config, domain)
+        def export(task):
+            return db.export_urls_csv(
+                self.db_config, filename, domain, columns, compress=compress,
+                progress_callback=lambda progress: self.worker.post(self.show_export_progress, progress),
+                cancel_event=task.cancel_event)
 
-        # Write URLs to a CSV file
-        try:
-            with open(filename, 'w', newline='') as file:
-                writer = csv.writer(file)
-                for url in urls:
-                    writer.writerow([url])
+        def on_success(result):
+            self.export_finished(f"{result['rows']} URLs exported.")
             messagebox.showinfo("Export Successful",
-                                f"URLs exported to {filename}.")
-        except Exception as e:
-            messagebox.showerror("Export Failed", f"An error occurred: {e}")
+                                f"{result['rows']} URLs exported to {filename}.")
+
+        def on_cancel(_):
+            self.export_finished("Export cancelled.")
+            messagebox.showinfo("Export Cancelled", f"{filename} was not written.")
+
+        def on_error(error):
+            self.export_finished("Export failed.")
+            self.show_db_error("Export Failed", error)
+
+        self.button_export_csv.config(state='disabled')
+        self.label_export_progress.config(text="Exporting...")
+        self.worker.submit("export", export, pass_task=True, on_success=on_success,
+                           on_cancel=on_cancel, on_error=on_error)
+
+    def show_export_progress(self, progress: dict) -> None:
+        percent = 100 * progress['rows'] / max(progress['total'], 1)
+        self.label_export_progress.config(
+            text=f"{percent:.0f}% - {progress['rows']} of {progress['total']} URLs")
+
+    def export_finished(self, message: str) -> None:
+        self.button_export_csv.config(state='normal')
+        self.label_export_progress.config(text=message)
 
     def update_vpn_status_display(self) -> None:
         """
         Fetches and displays the formatted VPN status along with the current default browser.
         """
-        status_info = vpn.get_vpn_status()  # Fetches the VPN status as a dictionary
+        # Latest cached status from the VPN monitor, no nordvpn process is started
+        status_info = self.vpn_monitor.snapshot()
+        checked_at = status_info.pop("checked_at", None)
+        if checked_at is not None:
+            status_info["checked"] = checked_at.strftime("%H:%M:%S")
 
         # Correctly reference the browser's name using self.selected_browser
         browser_info = f"Default Browser: {self.selected_browser}" if self.selected_browser else "No Browser Selected"
@@ -417,100 +842,171 @@ class URLManagerGUI(tk.Tk):
             formatted_status = "Unable to fetch VPN status."
 
         combined_status = f"{formatted_status}\n\n{browser_info}"
+        if self.vpn_server_stats:
+            combined_status += "\n\nServer history (last %d days):\n%s" % (
+                vpn_selection.HISTORY_DAYS, self.format_vpn_server_stats())
 
         self.text_vpn_status.config(state='normal')
         self.text_vpn_status.delete('1.0', tk.END)
         self.text_vpn_status.insert(tk.END, combined_status)
         self.text_vpn_status.config(state='disabled')
 
+    def format_vpn_server_stats(self) -> str:
+        """
+        One line per candidate server of the selected browser: success rate and connect time.
+        """
+        lines = []
+        for code, entry in self.vpn_server_stats.items():
+            if not entry["attempts"]:
+                lines.append(f"{code}: untried")
+                continue
+            avg = f"{entry['avg_seconds']:.1f}s avg" if entry["avg_seconds"] is not None else "never connected"
+            lines.append(f"{code}: {entry['successes']}/{entry['attempts']} ok, {avg}")
+        return "\n".join(lines)
+
+    def refresh_vpn_server_stats(self) -> None:
+        """
+        Reload the selected browser's rotation stats in the background, then redraw.
+        """
+        browser = self.browsers.get(self.selected_browser) if self.selected_browser else None
+        if browser is None:
+            self.vpn_server_stats = {}
+            return
+
+        def on_success(stats):
+            self.vpn_server_stats = stats
+            self.update_vpn_status_display()
+
+        self.worker.submit("VPN stats", vpn_selection.server_stats, self.db_config, browser,
+                           on_success=on_success)
+
+    def check_vpn_status(self) -> None:
+        """
+        Ask the VPN monitor to poll now and show the result once it has had time to arrive.
+        """
+        self.vpn_monitor.refresh()
+        self.after(1500, self.update_vpn_status_display)
+
     def load_urls(self) -> None:
         """
         Function to load the URLs based on weighted sampling without replacement.
         """
-        needed = int(self.entry_needed_urls.get())  # number of URLS required
+        try:
+            needed = int(self.entry_needed_urls.get())  # number of URLS required
+        except ValueError:
+            messagebox.showerror("Error", "Needed number of URLs must be an integer.")
+            return
         domain = self.domain_var.get()  # The current domain
-
-        self.loaded_urls = db.weighted_sample_without_replacement_new(
-            self.db_config, needed, domain)
-
-       # Check if the URL loading preference is 'Most Recent'
-        if self.url_loading_preference.get() == "Most Recent":
-            # Process each URL in the loaded_urls list
-            for i in range(len(self.loaded_urls)):
-                # Assuming the URL is the second item in each tuple
-                url = self.loaded_urls[i][1]
-                # Substitute 'page=xxxxx' with 'page=1'
-                new_url = re.sub(r'page=\d+', 'page=1', url)
-                # Update the tuple with the new URL
-                self.loaded_urls[i] = (self.loaded_urls[i][0], new_url)
-        elif self.url_loading_preference.get() == "Random page":
-            for i in range(len(self.loaded_urls)):
-                url = self.loaded_urls[i][1]
-                # Find the page number and replace it with a random number between 1 and the found page number
-
-                def randomize_page(match):
-                    page_num = int(match.group(1))
-                    if page_num > 1:
-                        return f"page={random.randint(1, page_num)}"
-                    else:
-                        # Return the original if page_num is 1 or less
-                        return match.group(0)
-                new_url = re.sub(r'page=(\d+)', randomize_page, url)
-                self.loaded_urls[i] = (self.loaded_urls[i][0], new_url)
-
-        # Update the display area with the selected URLs
-        # Enable the widget for updating
-        self.text_display_urls.config(state='normal')
-        self.text_display_urls.delete('1.0', tk.END)
-        # Sort by ID
-        for _, url in sorted(self.loaded_urls, key=lambda x: x[0]):
-            self.text_display_urls.insert(tk.END, url + '\n')
-        self.text_display_urls.config(
-            state='disabled')  # Make it read-only again
+        if domain == LOADING:
+            messagebox.showinfo("Please Wait", "The domains are still loading.")
+            return
+        preference = self.url_loading_preference.get()
+
+        def sample():
+            loaded_urls = db.weighted_sample_without_replacement(
+                self.db_config, needed, domain, mode=self.sampling_mode)
+
+           # Check if the URL loading preference is 'Most Recent'
+            if preference == "Most Recent":
+                # Process each URL in the loaded_urls list
+                for i in range(len(loaded_urls)):
+                    # Assuming the URL is the second item in each tuple
+                    url = loaded_urls[i][1]
+                    # Substitute 'page=xxxxx' with 'page=1'
+                    new_url = re.sub(r'page=\d+', 'page=1', url)
+                    # Update the tuple with the new URL
+                    loaded_urls[i] = (loaded_urls[i][0], new_url)
+            elif preference == "Random page":
+                for i in range(len(loaded_urls)):
+                    url = loaded_urls[i][1]
+                    # Find the page number and replace it with a random number between 1 and the found page number
+
+                    def randomize_page(match):
+                        page_num = int(match.group(1))
+                        if page_num > 1:
+                            return f"page={random.randint(1, page_num)}"
+                        else:
+                            # Return the original if page_num is 1 or less
+                            return match.group(0)
+                    new_url = re.sub(r'page=(\d+)', randomize_page, url)
+                    loaded_urls[i] = (loaded_urls[i][0], new_url)
+
+            # Weight and open count of each URL, for the table
+            stats = db.get_url_stats(self.db_config, [url_id for url_id, _ in loaded_urls])
+            rows = [(url_id, url) + stats.get(url_id, (None, None)) for url_id, url in loaded_urls]
+            return loaded_urls, rows
+
+        def on_success(result):
+            self.loaded_urls, rows = result
+            # Update the display area with the selected URLs, in one batch
+            self.table_urls.set_rows(rows)
+
+        # Sampling can take a while on a large domain, so it runs on the worker
+        self.worker.submit("load URLs", sample, on_success=on_success,
+                           on_error=partial(self.show_db_error, "Load URLs Failed"))
 
     def update_browser_dropdown(self) -> None:
-        # Assuming this fetches a dict of browsers
-        self.browsers = db.get_browsers(self.db_config)
+        # Fetches the dict of browsers in the background
+        self.worker.submit("browsers", db.get_browsers, self.db_config,
+                           on_success=self.on_browsers_loaded, on_error=self.on_lookup_error)
 
     def on_browser_selected(self, event=None) -> None:  # Event is passed by bind
         # Update the selected browser based on user selection
         self.selected_browser = self.browser_var.get()
         logging.info(f"Selected browser: {self.selected_browser}")
+        self.save_lookup_snapshot()
         # Optionally, update VPN status or other elements here
+        self.vpn_server_stats = {}
         self.update_vpn_status_display()
+        self.refresh_vpn_server_stats()
 
     def connect_vpn(self) -> None:
-        if self.selected_browser:  # Ensure a browser is selected
-            try:
-                # Attempt to connect to the VPN
-                if not vpn.connect_vpn(self.selected_browser, self.browsers):
-                    logging.critical("Failed to connect to VPN.")
-                    messagebox.showerror(
-                        "VPN Connection Failed", "Failed to establish a VPN connection. Please check your settings and try again.")
-                    return  # Exit the function, but don't quit the application
-                messagebox.showinfo(
-                    "VPN Connection", "VPN successfully connected")
-                # Optionally, update the VPN status display after connecting
-                self.update_vpn_status_display()
-            except Exception as e:
-                messagebox.showerror("VPN Connection Failed", str(e))
-        else:
+        if not self.selected_browser:  # Ensure a browser is selected
             messagebox.showwarning(
                 "No Browser Selected", "Please select a browser before connecting to the VPN.")
+            return
+
+        browser = self.browsers[self.selected_browser]
+
+        def on_success(connected):
+            if not connected:
+                logging.critical("Failed to connect to VPN.")
+                messagebox.showerror(
+                    "VPN Connection Failed", "Failed to establish a VPN connection. Please check your settings and try again.")
+            else:
+                messagebox.showinfo(
+                    "VPN Connection", "VPN successfully connected")
+            self.update_vpn_status_display()
+            self.refresh_vpn_server_stats()
+
+        def on_error(error):
+            messagebox.showerror("VPN Connection Failed", str(error))
+            self.update_vpn_status_display()
+
+        # The asyncio API times out hung nordvpn calls and backs off between retries;
+        # it runs in a worker thread so the window stays responsive meanwhile. The
+        # server is chosen from the browser's candidates and the outcome recorded.
+        self.worker.submit("connect VPN", vpn_selection.rotate_browser_vpn, self.db_config, browser,
+                           on_success=on_success, on_error=on_error)
 
     def disconnect_vpn(self) -> None:
-        try:
-            # Attempt to close the VPN connection
-            if not close_vpn_connection():
+        def on_success(status):
+            if status["status"] != "Disconnected":
                 logging.critical("Failed to disconnect VPN.")
                 messagebox.showerror(
                     "VPN Disconnection Failed", "Unable to disconnect from the VPN.")
-                return  # Exit the function, but don't quit the application
-            messagebox.showinfo(
-                "VPN Connection", "VPN successfully disconnected.")
+            else:
+                messagebox.showinfo(
+                    "VPN Connection", "VPN successfully disconnected.")
+            self.vpn_monitor.refresh()
             self.update_vpn_status_display()
-        except Exception as e:
-            messagebox.showerror("VPN Disconnection Failed", str(e))
+
+        def on_error(error):
+            messagebox.showerror("VPN Disconnection Failed", str(error))
+            self.vpn_monitor.refresh()
+
+        self.worker.submit("disconnect VPN", lambda: asyncio.run(vpn_async.disconnect()),
+                           on_success=on_success, on_error=on_error)
 
     def execute_open_urls(self) -> None:
         """
@@ -529,17 +1025,40 @@ class URLManagerGUI(tk.Tk):
 
         logging.info("execute_open_urls: Fetching URLs...")
 
-        # Use the stored list of URLs for opening
+        # Use the stored list of URLs for opening; the session runs on the shared scheduler
         try:
-            threading.Thread(target=open_urls, args=(
-                self, self.loaded_urls, selected_browser, self.db_config), daemon=True).start()
+            self.sessions.append(open_urls(
+                self, self.loaded_urls, selected_browser, self.db_config))
         except Exception as e:
             messagebox.showerror("Error Opening URLs", str(e))
 
+    def execute_open_urls_all_browsers(self) -> None:
+        """
+        Share the loaded URLs out between all configured browsers and open them
+        concurrently, one session per browser.
+        """
+        if not hasattr(self, 'loaded_urls') or not self.loaded_urls:
+            messagebox.showwarning(
+                "No URLs Loaded", "Please load URLs before opening.")
+            return
+        if not self.browsers:
+            messagebox.showwarning(
+                "No Browsers", "No browsers are configured in the database.")
+            return
+
+        assignments = split_round_robin(self.loaded_urls, list(self.browsers))
+        runner = SessionRunner(self.browsers, self.db_config, self.sleep_params,
+                               browser_sleep_params=self.browser_sleep_params,
+                               rotation_policy=self.rotation_policy)
+        logging.info(f"execute_open_urls_all_browsers: {len(self.loaded_urls)} URLs "
+                     f"across {len(assignments)} browsers")
+        self.sessions.extend(runner.start(assignments).values())
+
     def execute_query(gui_instance, domain, num_urls, from_date, popup):
         """
-        Form the query for url opening history and pass 
-        the details into db.execute_query()
+        Start paging through the url opening history: the query runs once
+        (see db.create_history_report()) and its first page is shown as soon
+        as it arrives
         """
 
         try:
@@ -548,59 +1067,14 @@ class URLManagerGUI(tk.Tk):
             messagebox.showerror(
                 "Error", "Number of URLs must be an integer", parent=popup)
             return
+        if num_urls_int < 1:
+            messagebox.showerror(
+                "Error", "Number of URLs must be at least 1", parent=popup)
+            return
 
-        query = """
-        SELECT  
-            urls.url, 
-            COUNT(URL_open_history.URL_id) AS occurrences
-        FROM 
-            URL_open_history 
-        JOIN 
-            urls 
-        ON 
-            URL_open_history.URL_id = urls.id
-        JOIN 
-            users_urls 
-        ON 
-            urls.id = users_urls.url_id
-        WHERE 
-            urls.domain = %s AND URL_open_history.timestamp >= %s
-        GROUP BY 
-            URL_open_history.URL_id, users_urls.page
-        HAVING 
-            COUNT(URL_open_history.URL_id) > 1
-        ORDER BY 
-            users_urls.page ASC, occurrences DESC
-        LIMIT %s
-        """
-
-        # Execute the query with your database connection
-        results = db.execute_query(
-            gui_instance.db_config, query, (domain, from_date, num_urls_int))
-
-        # Display the results in the query_results_display Text widget
-        gui_instance.query_results_display.config(
-            state='normal')  # Enable widget for update
-        gui_instance.query_results_display.delete(
-            '1.0', tk.END)  # Clear existing content
-
-        if results:
-            # Calculate the max URL length for formatting, with a minimum width, e.g., 70 characters
-            max_url_length = max(len(url) for url, occurrences in results)
-            max_url_length = max(max_url_length, 70)
-            # Header for the columns
-            header = f"{'URL'.ljust(max_url_length)}  Count\n"
-            divider = f"{'-' * max_url_length}  {'-' * 5}\n"
-            gui_instance.query_results_display.insert(tk.END, header)
-            gui_instance.query_results_display.insert(tk.END, divider)
-
-            for url, occurrences in results:
-                # Left-align the URL and right-align the count, with padding for alignment
-                line = f"{url.ljust(max_url_length)}  {str(occurrences).rjust(5)}\n"
-                gui_instance.query_results_display.insert(tk.END, line)
-            else:
-                gui_instance.query_results_display.insert(
-                    tk.END, "No results found.")
-
-            gui_instance.query_results_display.config(
-                state='disabled')  # Make it read-only again
+        # A new query replaces the previous one; late pages of the old one are dropped
+        if gui_instance.history_pager is not None:
+            gui_instance.history_pager.close()
+        gui_instance.history_pager = gui_open_history_popup.HistoryPager(
+            gui_instance, popup, domain, from_date, num_urls_int)
+        gui_instance.history_pager.start()
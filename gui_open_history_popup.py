@@ -1,10 +1,144 @@
 # gui code for the popup containing widgets and display area for viewing the url opening history.
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, PhotoImage
-from tkinter.scrolledtext import ScrolledText
 import db
-import mysql.connector as mysql
+import logging
+from collections import OrderedDict
+from url_table import URLTable
+
+HISTORY_COLUMNS = (("id", "ID", 70), ("url", "URL", 700), ("page", "Page", 60), ("opens", "Count", 70))
+MAX_CACHED_PAGES = 10  # pages kept in memory; older ones are fetched again by key
+
+
+class HistoryPager:
+    """
+    Pages through the URL opening history of one query, a page at a time.
+
+    The query runs once on the server, which stores its result as a report (see
+    db.create_history_report()); each page is then a cheap range read of that
+    report. Only the position at which each page starts is remembered, plus the
+    last MAX_CACHED_PAGES pages, so memory stays bounded however many pages there
+    are. Each page is fetched on the GUI worker, and the next one is prefetched as
+    soon as a page is shown, so "Next" is usually instant.
+    """
+
+    def __init__(self, gui_instance, popup, domain, from_date, page_size):
+        self.gui = gui_instance
+        self.popup = popup
+        self.domain = domain
+        self.from_date = from_date
+        self.page_size = page_size
+        self.report_id = None
+        self.total = None
+        self.keys = [0]             # keys[i]: position of the last row before page i
+        self.pages = OrderedDict()  # page index -> rows, most recently used last
+        self.pending = set()        # page indexes being fetched
+        self.wanted = None          # page to show once it arrives
+        self.current = None
+        self.closed = False
+
+    def start(self) -> None:
+        """
+        Run the query, then show the first page.
+        """
+        self.gui.query_results_status.config(text="Running query...")
+        self.gui.worker.submit(
+            "history query", db.create_history_report, self.gui.db_config, self.domain, self.from_date,
+            on_success=self._created, on_error=lambda error: self.gui.show_db_error("Query Failed", error))
+
+    def show(self, index: int) -> None:
+        """
+        Show page `index` (0-based), fetching it first if it is not cached.
+        """
+        if self.closed or self.report_id is None or index < 0 or index >= len(self.keys):
+            return
+        if index in self.pages:
+            self.pages.move_to_end(index)
+            self._display(index)
+            self._fetch(index + 1)
+        else:
+            self.wanted = index
+            self.gui.query_results_status.config(text=f"Loading page {index + 1}...")
+            self._fetch(index)
+
+    def next(self) -> None:
+        if self.current is not None:
+            self.show(self.current + 1)
+
+    def prev(self) -> None:
+        if self.current is not None:
+            self.show(self.current - 1)
+
+    def close(self) -> None:
+        """
+        Stop paging and drop the stored report.
+        """
+        if not self.closed:
+            self.closed = True
+            # A report still being created is dropped by _created()
+            if self.report_id is not None:
+                self._drop_report()
+
+    def _drop_report(self) -> None:
+        self.gui.worker.submit("drop history report", db.drop_history_report,
+                               self.gui.db_config, self.report_id)
+
+    def _created(self, result: tuple) -> None:
+        self.report_id, self.total = result
+        if self.closed or not self.popup.winfo_exists():
+            # Replaced or closed while the query ran
+            self.closed = True
+            self._drop_report()
+            return
+        self.show(0)
+
+    def _fetch(self, index: int) -> None:
+        if index in self.pages or index in self.pending or index >= len(self.keys):
+            return
+        self.pending.add(index)
+        self.gui.worker.submit(
+            f"history page {index + 1}", db.get_history_page, self.gui.db_config, self.report_id,
+            self.page_size, self.keys[index],
+            on_success=lambda result: self._loaded(index, *result),
+            on_error=lambda error: self._failed(index, error))
+
+    def _loaded(self, index: int, rows: list, last_position: int) -> None:
+        self.pending.discard(index)
+        if self.closed or not self.popup.winfo_exists():
+            return
+        self.pages[index] = rows
+        while len(self.pages) > MAX_CACHED_PAGES:
+            oldest = next(iter(self.pages))
+            if oldest == self.current:
+                self.pages.move_to_end(oldest)
+                continue
+            del self.pages[oldest]
+        # The next page, if there is one, starts after this page's last row
+        if index * self.page_size + len(rows) < self.total and index + 1 == len(self.keys):
+            self.keys.append(last_position)
+        if self.wanted == index:
+            self.wanted = None
+            self.show(index)
+
+    def _failed(self, index: int, error: Exception) -> None:
+        self.pending.discard(index)
+        if self.wanted == index:
+            self.wanted = None
+            self.gui.show_db_error("Query Failed", error)
+        else:
+            logging.error(f"Prefetching history page {index + 1} failed: {error!r}")
+
+    def _display(self, index: int) -> None:
+        rows = self.pages[index]
+        self.current = index
+        self.gui.query_results_table.set_rows(rows)
+        if not rows:
+            self.gui.query_results_status.config(text="No results found.")
+            return
+        first = index * self.page_size + 1
+        self.gui.query_results_status.config(
+            text=f"Page {index + 1}: URLs {first}-{first + len(rows) - 1} of {self.total}")
+
 
 def open_query_popup(gui_instance):
         # Create a new top-level window
@@ -19,7 +153,7 @@ def open_query_popup(gui_instance):
         domain_entry.insert(0, gui_instance.domain_var.get()) 
 
         # Number of URLs Entry
-        tk.Label(popup, text="Number of URLs to return:").pack(pady=(10, 0))
+        tk.Label(popup, text="Number of URLs per page:").pack(pady=(10, 0))
         num_urls_entry = tk.Entry(popup)
         num_urls_entry.pack(pady=(0, 10))
         num_urls_entry.insert(0, "20") 
@@ -39,13 +173,37 @@ def open_query_popup(gui_instance):
         ))
         query_button.pack(pady=(10, 0))
 
-        # Results display area with fixed-width font
-        text_display = ScrolledText(
-            popup, wrap=tk.WORD, width=120, height=20, font=('Courier', 10))
-        text_display.pack(pady=(10, 0))
-        text_display.config(state='disabled')  # Make it read-only
+        # Page controls
+        page_frame = tk.Frame(popup)
+        page_frame.pack(pady=(10, 0))
+        tk.Button(page_frame, text="< Prev", command=lambda: gui_instance.history_pager
+                  and gui_instance.history_pager.prev()).pack(side=tk.LEFT)
+        results_status = tk.Label(page_frame, text="")
+        results_status.pack(side=tk.LEFT, padx=(10, 10))
+        tk.Button(page_frame, text="Next >", command=lambda: gui_instance.history_pager
+                  and gui_instance.history_pager.next()).pack(side=tk.LEFT)
+
+        # Results table: sortable by clicking a heading, Ctrl+C copies the selected rows
+        results_table = URLTable(popup, columns=HISTORY_COLUMNS, height=20)
+        results_table.pack(pady=(5, 0), fill=tk.BOTH, expand=True)
 
         # Store for use in execute_query
-        gui_instance.query_results_display = text_display
+        gui_instance.query_results_table = results_table
+        gui_instance.query_results_status = results_status
+        # The results now go to this popup; stop paging (and drop the report of)
+        # a query still shown in an earlier one
+        if getattr(gui_instance, 'history_pager', None) is not None:
+            gui_instance.history_pager.close()
+        gui_instance.history_pager = None
+
+        def close_popup():
+            # Drop the stored report of this popup's query along with the window
+            pager = gui_instance.history_pager
+            if pager is not None and pager.popup is popup:
+                pager.close()
+                gui_instance.history_pager = None
+            popup.destroy()
+
+        popup.protocol("WM_DELETE_WINDOW", close_popup)
 
 
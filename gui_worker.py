@@ -0,0 +1,146 @@
+# gui_worker.py
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+"""
+Runs blocking work (MySQL queries, nordvpn calls, file I/O) off the Tk main thread.
+
+Tkinter is not thread-safe, so worker threads never touch a widget. Instead every
+result, error or progress report is put on a queue as a callable, and the Tk main
+loop drains that queue with `after()` and runs them. Callers read any widget values
+they need before submitting, and update widgets only from their callbacks.
+
+"""
+
+POLL_MS = 50
+
+
+class Task:
+    """
+    A unit of work submitted to a TkWorker.
+
+    The function may watch `cancel_event` to stop early. A cancelled task's result
+    goes to its on_cancel callback, if any, instead of on_success (None if the
+    function never ran).
+    """
+
+    def __init__(self, description: str):
+        self.description = description
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+        if self.future is not None:
+            # Never started: it will not run at all
+            self.future.cancel()
+
+
+class TkWorker:
+    """
+    Thread pool whose results are delivered on the Tk main thread.
+
+    Args:
+        root: The Tk root window, whose `after()` drives the result queue.
+        max_workers (int): Number of worker threads.
+        on_busy (callable, optional): Called on the Tk thread with the descriptions
+            of the running tasks whenever that list changes (empty when idle).
+    """
+
+    def __init__(self, root, max_workers: int = 4, on_busy: Optional[Callable] = None):
+        self.root = root
+        self.on_busy = on_busy
+        self.tasks = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-worker")
+        self._results = queue.Queue()
+        self.root.after(POLL_MS, self._poll)
+
+    def submit(self, description: str, fn: Callable, *args,
+               on_success: Optional[Callable] = None, on_error: Optional[Callable] = None,
+               on_cancel: Optional[Callable] = None, pass_task: bool = False) -> Task:
+        """
+        Run fn(*args) on a worker thread. Must be called from the Tk thread.
+
+        Args:
+            description: Short name shown by the busy indicator.
+            fn: The blocking function.
+            on_success: Called with fn's result on the Tk thread.
+            on_error: Called with the exception fn raised; by default it is logged.
+            on_cancel: Called with fn's result if the task was cancelled meanwhile,
+                or with None if it was cancelled before it started.
+            pass_task: Pass the Task as fn's `task` keyword, so fn can watch
+                `task.cancel_event` and report progress through post().
+
+        Returns:
+            Task: Handle to cancel the work.
+        """
+        task = Task(description)
+        kwargs = {"task": task} if pass_task else {}
+        task.future = self._executor.submit(fn, *args, **kwargs)
+        self.tasks.append(task)
+        self._notify_busy()
+        task.future.add_done_callback(
+            lambda future: self._results.put(lambda: self._deliver(task, on_success, on_error, on_cancel)))
+        return task
+
+    def post(self, callback: Callable, *args) -> None:
+        """
+        Run callback(*args) on the Tk thread. Safe to call from any thread.
+        """
+        self._results.put(lambda: callback(*args))
+
+    def cancel_all(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+    def shutdown(self) -> None:
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
+
+    def _deliver(self, task: Task, on_success, on_error, on_cancel) -> None:
+        self.tasks.remove(task)
+        self._notify_busy()
+        if task.future.cancelled():
+            logging.info(f"{task.description} cancelled before it started.")
+            # Still report it, so callers can restore what they changed on submit
+            if on_cancel is not None:
+                on_cancel(None)
+            return
+        error = task.future.exception()
+        if error is not None:
+            if on_error is not None:
+                on_error(error)
+            else:
+                logging.error(f"{task.description} failed: {error!r}")
+        elif task.cancelled:
+            if on_cancel is not None:
+                on_cancel(task.future.result())
+        elif on_success is not None:
+            on_success(task.future.result())
+
+    def _notify_busy(self) -> None:
+        if self.on_busy is not None:
+            self.on_busy([task.description for task in self.tasks])
+
+    def _poll(self) -> None:
+        try:
+            while True:
+                callback = self._results.get_nowait()
+                try:
+                    callback()
+                except Exception:
+                    logging.exception("GUI callback failed")
+        except queue.Empty:
+            pass
+        self.root.after(POLL_MS, self._poll)
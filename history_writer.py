@@ -0,0 +1,253 @@
+# history_writer.py
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import db
+from lazy import lazy_import
+
+mysql = lazy_import("mysql.connector")
+
+"""
+Write-behind buffer for URL_open_history.
+
+Launching a URL only queues its history row; a background thread writes the queued
+rows with one multi-row INSERT every `flush_rows` rows or `flush_interval` seconds.
+If the database cannot be reached the rows are appended to a local spool file
+(one JSON object per line), which is replayed ahead of new rows once a write
+succeeds again. Rows the database refuses outright (e.g. for a URL deleted in
+the meantime) can never be written, so they go to a quarantine file next to the
+spool instead, where they do not hold up the rows behind them.
+
+"""
+
+DEFAULT_FLUSH_ROWS = 50
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds
+DEFAULT_SPOOL_FILE = 'history_spool.jsonl'
+SPOOL_REPLAY_BATCH = 1000
+QUARANTINE_SUFFIX = '.rejected'
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _spool_line(row) -> str:
+    url_id, timestamp, browser_id = row
+    return json.dumps({'url_id': url_id, 'timestamp': timestamp.isoformat(),
+                       'browser_id': browser_id}) + '\n'
+
+
+class _WriteInterrupted(Exception):
+    """Raised when the database fails part-way through; carries the unwritten rows."""
+
+    def __init__(self, rows, cause):
+        super().__init__(str(cause))
+        self.rows = rows
+        self.cause = cause
+
+
+class HistoryWriter:
+    """
+    Background thread batching URL_open_history rows for one database.
+    """
+
+    def __init__(self, db_config, flush_rows=DEFAULT_FLUSH_ROWS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, spool_file=DEFAULT_SPOOL_FILE):
+        self.db_config = db_config
+        self.flush_rows = int(flush_rows)
+        self.flush_interval = float(flush_interval)
+        self.spool_file = spool_file
+        self.quarantine_file = spool_file + QUARANTINE_SUFFIX
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, url_id, browser_id, timestamp=None) -> None:
+        """
+        Queue one history row. Returns immediately.
+
+        Args:
+            url_id (int): The ID of the URL that was opened.
+            browser_id (int): The ID of the browser used to open the URL.
+            timestamp (datetime, optional): When it was opened. Defaults to now.
+        """
+        self._queue.put((url_id, timestamp or datetime.now(), browser_id))
+
+    def flush(self, timeout=None) -> None:
+        """
+        Write everything queued so far, blocking until done (or spooled).
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=10.0) -> None:
+        """
+        Flush the queue and stop the background thread.
+        """
+        if not self._closed.is_set():
+            self._closed.set()
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = False  # flush interval elapsed
+
+            if isinstance(item, tuple):
+                rows.append(item)
+                if len(rows) < self.flush_rows:
+                    continue
+
+            # Reached on a full batch, the interval, flush() (an Event) and close() (None)
+            try:
+                self._write(rows)
+            finally:
+                # Never leave flush() waiting, whatever happened to the write
+                rows = []
+                deadline = time.monotonic() + self.flush_interval
+                if isinstance(item, threading.Event):
+                    item.set()
+            if item is None:
+                return
+
+    def _write(self, rows) -> None:
+        try:
+            self._replay_spool()
+            self._insert(rows)
+        except Exception as e:
+            # Not only mysql.Error: anything escaping here would kill the writer
+            # thread and lose every later row
+            if isinstance(e, _WriteInterrupted):
+                rows, e = e.rows, e.cause
+            elif not isinstance(e, mysql.Error):
+                logging.exception("Unexpected error writing history rows")
+            if rows:
+                logging.error(f"Cannot write {len(rows)} history rows ({e!r}); spooling to {self.spool_file}.")
+                try:
+                    self._spool(rows)
+                except OSError as spool_error:
+                    logging.error(f"Cannot spool history rows to {self.spool_file} ({spool_error}); "
+                                  f"{len(rows)} rows lost.")
+
+    def _insert(self, rows) -> None:
+        """
+        Write rows in one transaction. If the database refuses the batch because of
+        its data, retry row by row and quarantine the rows it refuses.
+
+        Raises:
+            _WriteInterrupted: With the rows not yet written, if the database fails
+                for another reason (e.g. the connection) during the retry.
+        """
+        try:
+            db.insert_url_open_history_many(rows, self.db_config)
+            return
+        except (mysql.DataError, mysql.IntegrityError) as e:
+            logging.warning(f"Batch of {len(rows)} history rows refused ({e}), retrying row by row.")
+        rejected = []
+        for i, row in enumerate(rows):
+            try:
+                db.insert_url_open_history_many([row], self.db_config)
+            except (mysql.DataError, mysql.IntegrityError) as e:
+                rejected.append((row, e))
+            except mysql.Error as e:
+                self._quarantine(rejected)
+                raise _WriteInterrupted(rows[i:], e)
+        self._quarantine(rejected)
+
+    def _quarantine(self, rejected) -> None:
+        if not rejected:
+            return
+        for row, error in rejected:
+            logging.error(f"History row {row} refused ({error}); moved to {self.quarantine_file}.")
+        with open(self.quarantine_file, 'a') as file:
+            file.writelines(_spool_line(row) for row, _ in rejected)
+
+    def _spool(self, rows) -> None:
+        with open(self.spool_file, 'a') as file:
+            file.writelines(_spool_line(row) for row in rows)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _replay_spool(self) -> None:
+        # Only the writer thread touches the spool, so no locking is needed
+        if not os.path.exists(self.spool_file) or os.path.getsize(self.spool_file) == 0:
+            return
+        rows = []
+        malformed = False
+        with open(self.spool_file, 'r') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    rows.append((entry['url_id'], datetime.fromisoformat(entry['timestamp']),
+                                 entry['browser_id']))
+                except (ValueError, KeyError, TypeError) as e:
+                    # e.g. a line torn by a crash while spooling
+                    logging.warning(f"Dropping malformed line {line_number} of {self.spool_file}: {e!r}")
+                    malformed = True
+        if malformed:
+            # Keep only the readable rows, so the warnings are not repeated every flush
+            self._rewrite_spool(rows)
+        for start in range(0, len(rows), SPOOL_REPLAY_BATCH):
+            remaining = rows[start + SPOOL_REPLAY_BATCH:]
+            try:
+                self._insert(rows[start:start + SPOOL_REPLAY_BATCH])
+            except _WriteInterrupted as e:
+                self._rewrite_spool(e.rows + remaining)
+                raise e.cause
+            # Rewrite what is left so a failure part-way never replays rows twice
+            self._rewrite_spool(remaining)
+        if rows:
+            logging.info(f"Replayed {len(rows)} spooled history rows.")
+
+    def _rewrite_spool(self, rows) -> None:
+        tmp_file = self.spool_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            file.writelines(_spool_line(row) for row in rows)
+        os.replace(tmp_file, self.spool_file)
+
+
+def get_history_writer(db_config, **options) -> HistoryWriter:
+    """
+    Return the process-wide HistoryWriter for db_config, starting it on first use.
+
+    Args:
+        db_config (dict): Database configuration.
+        **options: flush_rows, flush_interval and spool_file, used only when the
+            writer is created.
+
+    Returns:
+        HistoryWriter: The shared writer.
+    """
+    key = db._pool_key(db_config)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = HistoryWriter(db_config, **options)
+            _writers[key] = writer
+    return writer
+
+
+@atexit.register
+def close_history_writers() -> None:
+    """
+    Flush and stop every writer, e.g. on application exit.
+    """
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
@@ -0,0 +1,55 @@
+# lazy.py
+import importlib
+import sys
+import threading
+import types
+
+"""
+Deferred imports for the heavy dependencies (numpy, pandas, yaml, mysql.connector,
+pyarrow), so that starting the GUI does not pay for them before the window
+is drawn.
+
+    np = lazy_import("numpy")
+
+binds a placeholder module that performs the real import the first time one of its
+attributes is used, from whichever thread gets there first. Annotations that name
+a lazy module must not be evaluated at import time, so modules using this start
+with `from __future__ import annotations`.
+
+"""
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported on first attribute access.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return `name` if it is already imported, otherwise a LazyModule for it.
+
+    A missing module raises ImportError on first use rather than here.
+    """
+    return sys.modules.get(name) or LazyModule(name)
@@ -0,0 +1,74 @@
+# lookup_snapshot.py
+import json
+import logging
+import os
+from datetime import datetime
+
+"""
+Local snapshot of the lookup tables the GUI is built from.
+
+The `browsers` and `domains` tables hardly ever change, so the GUI saves them,
+together with the last selected domain and browser, to a small JSON file. On the
+next start the dropdowns are filled from it at once, before MySQL has answered, and
+the app can still come up when the database is unreachable.
+
+The file carries a format version; a snapshot of another version is ignored.
+
+"""
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_FILE = 'lookup_snapshot.json'
+
+
+def load_snapshot(snapshot_file) -> dict:
+    """
+    Read the snapshot, or return None if there is no usable one.
+
+    Returns:
+        dict: 'browsers', 'domains', 'default_domain', 'selected_domain',
+        'selected_browser' and 'saved_at'.
+    """
+    try:
+        with open(snapshot_file, 'r') as file:
+            snapshot = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable lookup snapshot {snapshot_file}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        logging.warning(f"Ignoring lookup snapshot {snapshot_file}: not version {SNAPSHOT_VERSION}.")
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot_file, browsers, domains, default_domain,
+                  selected_domain=None, selected_browser=None) -> None:
+    """
+    Write the snapshot. Failures are logged, never raised: the snapshot is only a cache.
+
+    Args:
+        snapshot_file (str): Path of the JSON file.
+        browsers (dict): Browser configurations from db.get_browsers().
+        domains (list): Domain names from db.get_domains().
+        default_domain (str): The default domain from db.get_domains().
+        selected_domain (str, optional): The domain selected in the GUI.
+        selected_browser (str, optional): The browser selected in the GUI.
+    """
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': datetime.now().isoformat(timespec='seconds'),
+        'browsers': browsers,
+        'domains': domains,
+        'default_domain': default_domain,
+        'selected_domain': selected_domain,
+        'selected_browser': selected_browser,
+    }
+    # Write to a temporary file and rename, so a crash never leaves a torn snapshot
+    tmp_file = snapshot_file + '.tmp'
+    try:
+        with open(tmp_file, 'w') as file:
+            json.dump(snapshot, file, indent=1)
+        os.replace(tmp_file, snapshot_file)
+    except OSError as e:
+        logging.warning(f"Could not save lookup snapshot {snapshot_file}: {e}")
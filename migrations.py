@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# migrations.py
+import logging
+import sys
+from datetime import datetime
+
+import db
+
+"""
+Versioned schema migrations, and a check that the hot queries use indexes.
+
+Each migration has a version number, a description and a list of steps; a step is
+either an SQL statement or a function taking a cursor. The versions applied are
+recorded in the schema_version table, and `migrate` applies the pending ones in
+order. MySQL commits DDL implicitly, so every step is written to be idempotent
+(IF NOT EXISTS, or an information_schema check first): a migration interrupted
+part-way simply runs again.
+
+`check` runs EXPLAIN on every query in db.HOT_QUERIES and fails if any of them
+reads a whole table, except for the small lookup tables in ALLOW_FULL_SCAN. The
+plans depend on table statistics, so run it against a database of realistic size.
+
+Usage:
+    python migrations.py [config.yml] migrate|status|check
+"""
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT NOT NULL PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at DATETIME NOT NULL
+)
+"""
+
+# A handful of rows each; reading them whole is cheaper than any index
+ALLOW_FULL_SCAN = {'browsers', 'domains', 'schema_version'}
+
+
+def create_index(table, name, columns):
+    """
+    Return a migration step creating an index, unless the table already has one
+    whose leading columns are `columns`.
+    """
+    def step(cursor):
+        cursor.execute(
+            "SELECT index_name, column_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s "
+            "ORDER BY index_name, seq_in_index", (table,))
+        indexes = {}
+        for index_name, column_name in cursor.fetchall():
+            indexes.setdefault(index_name, []).append(column_name.lower())
+        wanted = [column.lower() for column in columns]
+        for index_name, index_columns in indexes.items():
+            if index_columns[:len(wanted)] == wanted:
+                logging.info(f"{table} already has index {index_name} on {', '.join(columns)}.")
+                return
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+        logging.info(f"Created index {name} on {table} ({', '.join(columns)}).")
+    step.__doc__ = f"index {name} on {table} ({', '.join(columns)})"
+    return step
+
+
+def backfill_rollup(cursor):
+    """url_open_daily rebuilt from the existing URL_open_history"""
+    written = db.backfill_rollup_windows(
+        cursor, lambda: cursor.execute("COMMIT"),
+        progress_callback=lambda day, last_day: print(f"  backfilled up to {day} of {last_day}"))
+    logging.info(f"Backfilled {written} url_open_daily rows.")
+
+
+MIGRATIONS = [
+    (1, "Rollup and VPN rotation tables", [
+        db.URL_OPEN_DAILY_TABLE,
+        db.VPN_ROTATION_TABLE,
+    ]),
+    (2, "Indexes for the hot queries", [
+        # Sampling and loading filter urls by domain, and read only id and weight
+        create_index('urls', 'idx_urls_domain_weight', ['domain', 'weight']),
+        # History joins on URL_id and filters on timestamp; the backfill scans by time
+        create_index('URL_open_history', 'idx_history_url_time', ['URL_id', 'timestamp']),
+        create_index('URL_open_history', 'idx_history_time', ['timestamp']),
+        # The history report joins users_urls on url_id and groups by page
+        create_index('users_urls', 'idx_users_urls_url_page', ['url_id', 'page']),
+    ]),
+    (3, "History report table", [
+        db.HISTORY_REPORT_TABLE,
+    ]),
+    # Reports read opens from the rollup alone, so it must cover the history
+    # recorded before it existed
+    (4, "Backfill url_open_daily from URL_open_history", [
+        db.URL_OPEN_DAILY_TABLE,
+        backfill_rollup,
+    ]),
+]
+
+
+def current_version(cursor) -> int:
+    cursor.execute(SCHEMA_VERSION_TABLE)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(db_config) -> int:
+    """
+    Apply every pending migration in order.
+
+    Returns:
+        int: The schema version afterwards.
+    """
+    with db.get_connection(db_config) as conn, conn.cursor() as cursor:
+        version = current_version(cursor)
+        for number, description, steps in MIGRATIONS:
+            if number <= version:
+                continue
+            logging.info(f"Applying migration {number}: {description}")
+            print(f"Applying migration {number}: {description}")
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute("INSERT INTO schema_version (version, description, applied_at) "
+                           "VALUES (%s, %s, %s)", (number, description, datetime.now()))
+            conn.commit()
+            version = number
+    return version
+
+
+def status(db_config) -> None:
+    with db.get_connection(db_config) as conn, conn.cursor() as cursor:
+        version = current_version(cursor)
+    print(f"Schema version {version}.")
+    for number, description, _ in MIGRATIONS:
+        print(f"  {number}: {description}{'' if number <= version else '  (pending)'}")
+
+
+def check(db_config) -> bool:
+    """
+    EXPLAIN every hot query and report any that reads a whole table.
+
+    Returns:
+        bool: True if no query does a full scan outside ALLOW_FULL_SCAN.
+    """
+    ok = True
+    with db.get_connection(db_config) as conn, conn.cursor(dictionary=True) as cursor:
+        for name, (query, params) in db.HOT_QUERIES.items():
+            cursor.execute("EXPLAIN " + query, params)
+            plan = cursor.fetchall()
+            scans = [row['table'] for row in plan
+                     if row['type'] == 'ALL' and row['table'] not in ALLOW_FULL_SCAN]
+            summary = ", ".join(f"{row['table']}:{row['type']}({row['key'] or '-'})" for row in plan)
+            print(f"{'FAIL' if scans else 'ok  '} {name}: {summary}")
+            ok = ok and not scans
+    return ok
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    command = args.pop() if args and args[-1] in ('migrate', 'status', 'check') else 'status'
+    config_file = args[0] if args else 'config.yml'
+    db_config = db.load_config(config_file)['db_config']
+
+    if command == 'migrate':
+        print(f"Schema is at version {migrate(db_config)}.")
+    elif command == 'check':
+        if not check(db_config):
+            sys.exit("Full table scans found; run `python migrations.py migrate` or add an index.")
+    else:
+        status(db_config)
+    db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# scheduler.py
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Timer-heap scheduler shared by every URL-opening session.
+
+A single thread keeps all pending timers in a heap ordered by due time and sleeps
+on a condition variable until the earliest is due, or until a new timer is added.
+Due callbacks are handed to a small worker pool so that a slow launch never delays
+another session's timer. Sessions therefore hold no thread while they wait.
+
+"""
+
+DEFAULT_WORKERS = 4
+
+
+class TimerHandle:
+    """
+    Returned by Scheduler.call_later(); lets the caller cancel the timer.
+    """
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        # The heap entry stays until it surfaces, then it is skipped
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    One timer thread plus a worker pool that runs the callbacks.
+
+    Args:
+        max_workers (int): Number of threads running due callbacks.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        self._heap = []
+        self._counter = itertools.count()  # tie-breaker so handles are never compared
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler-worker")
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, callback, *args, pass_handle=False) -> TimerHandle:
+        """
+        Run callback(*args) on a worker thread after `delay` seconds.
+
+        A timer cancelled after it fell due may already be queued for a worker. It is
+        still skipped if the worker has not started it, but a callback that must never
+        run once cancelled should take `pass_handle` and check the handle itself.
+
+        Args:
+            pass_handle (bool): Call callback(handle, *args) instead.
+
+        Returns:
+            TimerHandle: Handle to cancel the timer.
+        """
+        handle = TimerHandle(time.monotonic() + max(delay, 0), callback, args)
+        if pass_handle:
+            handle.args = (handle,) + args
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down.")
+            heapq.heappush(self._heap, (handle.due, next(self._counter), handle))
+            # Wake the timer thread in case this is now the earliest timer
+            self._condition.notify()
+        return handle
+
+    def shutdown(self, wait=False) -> None:
+        """
+        Stop the timer thread, dropping pending timers, and the worker pool.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._heap.clear()
+            self._condition.notify()
+        self._executor.shutdown(wait=wait)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._shutdown:
+                    if self._heap and self._heap[0][0] <= time.monotonic():
+                        break
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._shutdown:
+                    return
+                _, _, handle = heapq.heappop(self._heap)
+            if not handle.cancelled:
+                self._executor.submit(self._call, handle)
+
+    @staticmethod
+    def _call(handle) -> None:
+        # The timer may have been cancelled while waiting for a free worker
+        if handle.cancelled:
+            return
+        try:
+            handle.callback(*handle.args)
+        except Exception:
+            logging.exception(f"Scheduled callback {handle.callback!r} failed")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """
+    Return the process-wide scheduler, starting it on first use.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
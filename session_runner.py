@@ -0,0 +1,95 @@
+# session_runner.py
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+from scheduler import Scheduler, get_scheduler
+from utils import LaunchSession, RotationPolicy
+
+"""
+Runs URL-opening sessions for several browsers at once.
+
+Each browser gets its own LaunchSession working through its own URL list on its own
+sleep schedule. All sessions share one scheduler thread, whose worker pool performs
+the launches, as well as the write-behind history writer and the VPN lock, and each
+session reports its own throughput.
+
+"""
+
+
+class SessionRunner:
+    """
+    Drive several browsers' URL lists concurrently.
+
+    Args:
+        browsers (dict): Browser configurations from db.get_browsers().
+        db_config (dict): Database configuration.
+        sleep_params (tuple): Default (min, max) seconds between launches.
+        browser_sleep_params (dict, optional): Per-browser (min, max) overrides.
+        max_workers (int, optional): Size of a dedicated launch worker pool; by
+            default the process-wide scheduler and its pool are shared.
+        rotation_policy (RotationPolicy, optional): VPN rotation policy for every session.
+    """
+
+    def __init__(self, browsers: Dict, db_config: Dict, sleep_params: Tuple[int, int],
+                 browser_sleep_params: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_workers: Optional[int] = None, rotation_policy: Optional[RotationPolicy] = None):
+        self.browsers = browsers
+        self.db_config = db_config
+        self.sleep_params = sleep_params
+        self.browser_sleep_params = browser_sleep_params or {}
+        self.scheduler = Scheduler(max_workers) if max_workers else get_scheduler()
+        self.rotation_policy = rotation_policy
+        self.sessions: Dict[str, LaunchSession] = {}
+
+    def start(self, assignments: Dict[str, List[Tuple[Union[int, str], str]]]) -> Dict[str, LaunchSession]:
+        """
+        Start one session per browser and return at once.
+
+        Args:
+            assignments: Mapping of browser name to its list of (id, url) tuples.
+
+        Returns:
+            dict: The running LaunchSession of each browser.
+        """
+        unknown = set(assignments) - set(self.browsers)
+        if unknown:
+            raise ValueError(f"Unknown browsers: {sorted(unknown)}")
+
+        for name, urls in assignments.items():
+            self.sessions[name] = LaunchSession(
+                name, self.browsers[name], urls,
+                self.browser_sleep_params.get(name, self.sleep_params),
+                self.db_config, scheduler=self.scheduler,
+                rotation_policy=self.rotation_policy).start()
+        return self.sessions
+
+    def run(self, assignments: Dict[str, List[Tuple[Union[int, str], str]]]) -> Dict[str, Dict]:
+        """
+        Open every browser's URLs, blocking until all sessions finish or stop() is called.
+
+        Returns:
+            dict: Each browser's throughput stats (see LaunchSession.stats).
+        """
+        self.start(assignments)
+        results = {name: session.wait() for name, session in self.sessions.items()}
+        for stats in results.values():
+            logging.info(f"Browser session stats: {stats}")
+        return results
+
+    def stop(self) -> None:
+        """
+        Cancel every session of this runner.
+        """
+        for session in self.sessions.values():
+            session.cancel()
+
+
+def split_round_robin(urls_with_ids: List[Tuple[Union[int, str], str]],
+                      browser_names: List[str]) -> Dict[str, List[Tuple[Union[int, str], str]]]:
+    """
+    Share one list of URLs out between browsers, in turn.
+
+    Returns:
+        dict: Mapping of browser name to its share of the URLs.
+    """
+    return {name: urls_with_ids[i::len(browser_names)] for i, name in enumerate(browser_names)}
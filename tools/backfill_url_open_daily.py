@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Rebuild the url_open_daily rollup from the existing URL_open_history rows.
+
+`python migrations.py migrate` runs it once when upgrading; run this at any time
+to repair the rollup. It is safe to run while the app is recording launches, and
+to re-run after an interruption.
+
+Usage:
+    python tools/backfill_url_open_daily.py [config.yml] [days per batch]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import db  # noqa: E402
+
+
+def main() -> None:
+    config_file = sys.argv[1] if len(sys.argv) > 1 else 'config.yml'
+    batch_days = int(sys.argv[2]) if len(sys.argv) > 2 else db.BACKFILL_DAYS
+    db_config = db.load_config(config_file)['db_config']
+
+    written = db.backfill_url_open_daily(
+        db_config, batch_days,
+        progress_callback=lambda day, last_day: print(f"  up to {day} of {last_day}"))
+    print(f"Wrote {written} url_open_daily rows.")
+    db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
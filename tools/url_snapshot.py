@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Export the urls table to a Parquet or Arrow IPC snapshot, or import one.
+
+The format follows the file extension: '.parquet', or '.arrow'/'.feather'.
+Snapshots hold id, url, domain and weight; an import keeps the URLs already in
+the database and gives the new ones fresh ids. Needs pyarrow.
+
+Usage:
+    python tools/url_snapshot.py export FILE [DOMAIN] [--config config.yml]
+    python tools/url_snapshot.py import FILE [DOMAIN] [--config config.yml] [--insert]
+
+On import, DOMAIN overrides the domains recorded in the snapshot. --insert uses
+multi-row INSERTs instead of LOAD DATA LOCAL INFILE.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import db  # noqa: E402
+
+
+def print_progress(progress: dict) -> None:
+    print(f"  {progress['rows']} of {progress['total']} rows")
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    config_file = 'config.yml'
+    if '--config' in args:
+        index = args.index('--config')
+        config_file = args[index + 1]
+        del args[index:index + 2]
+    use_load_data = '--insert' not in args
+    args = [arg for arg in args if arg != '--insert']
+    if len(args) not in (2, 3) or args[0] not in ('export', 'import'):
+        sys.exit(__doc__)
+    command, filename = args[0], args[1]
+    domain = args[2] if len(args) > 2 else None
+    db_config = db.load_config(config_file)['db_config']
+
+    if command == 'export':
+        result = db.export_urls_snapshot(db_config, filename, domain,
+                                         progress_callback=print_progress)
+        print(f"Exported {result['rows']} URLs to {filename}.")
+    else:
+        result = db.import_urls_snapshot(db_config, filename, domain, use_load_data=use_load_data,
+                                         progress_callback=print_progress)
+        print(f"Imported {filename}: {result['inserted']} new, {result['duplicate']} duplicate, "
+              f"{result['rejected']} rejected.")
+    db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
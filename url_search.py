@@ -0,0 +1,229 @@
+# url_search.py
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import db
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+"""
+Substring search over the `urls` table, backed by an in-memory trigram index.
+
+Every URL is broken into its overlapping 3-byte sequences and each trigram maps
+to the sorted positions of the URLs containing it. A query is answered by
+intersecting the posting lists of its own trigrams, which narrows millions of URLs
+to a handful of candidates, and then confirming the substring on those alone.
+Matching is case-insensitive.
+
+"""
+
+DEFAULT_PAGE_SIZE = 50
+BUILD_CHUNK = 8192           # URLs encoded and indexed per NumPy pass
+MAX_CACHED_SEARCHES = 32     # confirmed match lists kept for paging
+
+
+def trigram_codes(data: bytes) -> np.ndarray:
+    """Return the 24-bit codes of the overlapping byte trigrams of data."""
+    buffer = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    return (buffer[:-2] << 16) | (buffer[1:-1] << 8) | buffer[2:]
+
+
+def run_starts(values: np.ndarray) -> np.ndarray:
+    """Return the index where each run of equal values of a sorted array starts."""
+    if not values.size:
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+
+
+class TrigramIndex:
+    """
+    Immutable trigram index over (id, url, domain) rows.
+
+    Trigrams are taken over the UTF-8 bytes of the lowercased URLs, so that they
+    can be computed and sorted with NumPy a chunk of URLs at a time: a substring
+    of the text is also a substring of its bytes. The postings of all trigrams are
+    one array of URL positions, sliced per trigram through `gram_offsets`.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, str, str]]):
+        ids, self.urls, self.lower_urls, domain_codes = [], [], [], []
+        self.domains: List[str] = []
+        domain_lookup = {}
+        for url_id, url, domain in rows:
+            ids.append(url_id)
+            self.urls.append(url)
+            lower = url.lower()
+            # Most URLs are lowercase already; share the string rather than copy it
+            self.lower_urls.append(url if lower == url else lower)
+            if domain not in domain_lookup:
+                domain_lookup[domain] = len(self.domains)
+                self.domains.append(domain)
+            domain_codes.append(domain_lookup[domain])
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.domain_codes = np.asarray(domain_codes, dtype=np.int32)
+        self._domain_lookup = domain_lookup
+        self._build_postings()
+        self._matches = OrderedDict()
+        self._matches_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def _chunk_postings(self, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        # (code, position) of every distinct trigram of URLs start..stop, sorted by
+        # code and then position
+        encoded = [url.encode('utf-8') for url in self.lower_urls[start:stop]]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        codes = trigram_codes(b''.join(encoded))
+        if not codes.size:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        owners = np.repeat(np.arange(start, start + len(encoded), dtype=np.int64), lengths)[:codes.size]
+        ends = np.repeat(np.cumsum(lengths), lengths)[:codes.size]
+        # Drop the trigrams that straddle two URLs
+        inside = np.arange(codes.size) + 2 < ends
+        keys = np.sort(codes[inside] * len(self.urls) + owners[inside])
+        keys = keys[run_starts(keys)]
+        return keys // len(self.urls), keys % len(self.urls)
+
+    def _build_postings(self) -> None:
+        # Two passes over the URLs: count the postings of each trigram, then place
+        # every chunk's positions at its trigrams' write offsets. Chunks come in URL
+        # order, so every posting list ends up sorted.
+        chunks = range(0, len(self.urls), BUILD_CHUNK)
+        chunk_codes = [np.empty(0, dtype=np.int64)]
+        chunk_counts = [np.empty(0, dtype=np.int64)]
+        for start in chunks:
+            codes, _ = self._chunk_postings(start, start + BUILD_CHUNK)
+            first = run_starts(codes)
+            chunk_codes.append(codes[first])
+            chunk_counts.append(np.diff(np.r_[first, codes.size]))
+        codes, counts = np.concatenate(chunk_codes), np.concatenate(chunk_counts)
+        del chunk_codes, chunk_counts
+        self.gram_codes = np.sort(codes)
+        self.gram_codes = self.gram_codes[run_starts(self.gram_codes)]
+        counts = np.bincount(np.searchsorted(self.gram_codes, codes), weights=counts,
+                             minlength=len(self.gram_codes)).astype(np.int64)
+        self.gram_offsets = np.zeros(len(self.gram_codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.gram_offsets[1:])
+
+        self.postings = np.empty(self.gram_offsets[-1], dtype=np.uint32)
+        write = self.gram_offsets[:-1].copy()
+        for start in chunks:
+            codes, positions = self._chunk_postings(start, start + BUILD_CHUNK)
+            if not codes.size:
+                continue
+            grams = np.searchsorted(self.gram_codes, codes)
+            first = run_starts(grams)
+            counts = np.diff(np.r_[first, grams.size])
+            rank = np.arange(grams.size) - np.repeat(first, counts)
+            self.postings[write[grams] + rank] = positions
+            write[grams[first]] += counts
+
+    def _posting(self, code: int) -> Optional[np.ndarray]:
+        i = np.searchsorted(self.gram_codes, code)
+        if i == len(self.gram_codes) or self.gram_codes[i] != code:
+            return None
+        return self.postings[self.gram_offsets[i]:self.gram_offsets[i + 1]]
+
+    def _candidates(self, query: bytes) -> np.ndarray:
+        codes = set(trigram_codes(query).tolist()) if len(query) >= 3 else set()
+        if not codes:
+            # Too short to use the index: every URL is a candidate
+            return np.arange(len(self.urls), dtype=np.uint32)
+        lists = []
+        for code in codes:
+            positions = self._posting(code)
+            if positions is None:
+                return np.empty(0, dtype=np.uint32)
+            lists.append(positions)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for positions in lists[1:]:
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+            if not candidates.size:
+                break
+        return candidates
+
+    def _find(self, query: str, domain: Optional[str]) -> np.ndarray:
+        # Positions of every URL containing query (already lowercased)
+        encoded = query.encode('utf-8')
+        candidates = self._candidates(encoded)
+        if domain is not None:
+            code = self._domain_lookup.get(domain)
+            if code is None:
+                return np.empty(0, dtype=np.uint32)
+            candidates = candidates[self.domain_codes[candidates] == code]
+        if len(encoded) == 3:
+            return candidates  # a single trigram's postings are exact
+        # Trigrams only prove the pieces are present; confirm the whole substring
+        lower_urls = self.lower_urls
+        return np.asarray([i for i in candidates.tolist() if query in lower_urls[i]], dtype=np.uint32)
+
+    def search(self, query: str, domain: Optional[str] = None,
+               page: int = 0, page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[list, int]:
+        """
+        Find the URLs containing query.
+
+        The matches of the last few (query, domain) pairs are kept, so moving
+        between the pages of a search costs only the rows of the page.
+
+        Args:
+            query (str): Substring to look for, case-insensitive.
+            domain (str, optional): Only return URLs of this domain.
+            page (int): 0-based page number.
+            page_size (int): Results per page.
+
+        Returns:
+            tuple: (rows, total) where rows are the (id, url, domain) tuples of the
+            requested page, in index order, and total is the number of matches.
+        """
+        key = (query.lower(), domain)
+        with self._matches_lock:
+            matches = self._matches.get(key)
+            if matches is not None:
+                self._matches.move_to_end(key)
+        if matches is None:
+            matches = self._find(*key)
+            with self._matches_lock:
+                self._matches[key] = matches
+                while len(self._matches) > MAX_CACHED_SEARCHES:
+                    self._matches.popitem(last=False)
+
+        start = page * page_size
+        rows = [(int(self.ids[i]), self.urls[i], self.domains[self.domain_codes[i]])
+                for i in matches[start:start + page_size].tolist()]
+        return rows, len(matches)
+
+
+class URLSearchIndex:
+    """
+    A TrigramIndex over the whole `urls` table, built on first use and rebuilt
+    after invalidate() is called for a write.
+    """
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+        self._index = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Mark the index stale after URLs were added or removed."""
+        self._index = None
+
+    def get_index(self) -> TrigramIndex:
+        with self._lock:
+            if self._index is None:
+                rows = db.get_all_urls(self.db_config, columns=('id', 'url', 'domain'))
+                self._index = TrigramIndex(rows)
+            return self._index
+
+    def search(self, query: str, domain: Optional[str] = None,
+               page: int = 0, page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[list, int]:
+        """
+        Search the URLs, building the index first if needed. See TrigramIndex.search().
+        """
+        return self.get_index().search(query, domain, page, page_size)
@@ -0,0 +1,200 @@
+# url_table.py
+import tkinter as tk
+from operator import itemgetter
+from tkinter import ttk
+from typing import List, Sequence, Tuple
+
+"""
+A virtualized table of rows for the GUI, built on ttk.Treeview.
+
+The rows are kept in a Python list and only the window of rows that fits on screen
+is ever inserted into the Treeview; scrolling rewrites the values of those few
+items instead of adding one item per row. Loading, sorting and scrolling therefore
+cost the same whether there are ten rows or a million.
+
+Clicking a column heading sorts the rows in memory (again to reverse). Ctrl+A
+selects every row, not just the visible ones, and Ctrl+C copies the selected rows
+to the clipboard as tab-separated lines.
+
+"""
+
+URL_COLUMNS = (("id", "ID", 70), ("url", "URL", 600), ("weight", "Weight", 70), ("opens", "Opens", 70))
+# event.state bits of the modifiers that extend a selection instead of replacing it
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+
+class URLTable(ttk.Frame):
+    """
+    Scrollable, sortable table showing a window of a list of row tuples.
+
+    Args:
+        master: The parent widget.
+        columns: (name, heading, width) for each column, in row tuple order.
+        height (int): Number of visible rows.
+    """
+
+    def __init__(self, master, columns: Sequence[Tuple[str, str, int]] = URL_COLUMNS,
+                 height: int = 15, **kwargs):
+        super().__init__(master, **kwargs)
+        self.columns = [name for name, _, _ in columns]
+        self.headings = {name: heading for name, heading, _ in columns}
+        self.height = height
+        self.rows = []
+        self.sort_column = None
+        self.sort_descending = False
+        self._offset = 0         # index of the first visible row
+        self._selected = set()   # id() of the selected row tuples
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show='headings',
+                                 height=height, selectmode='extended')
+        for name, heading, width in columns:
+            self.tree.heading(name, text=heading, command=lambda name=name: self.sort_by(name))
+            self.tree.column(name, width=width, stretch=(name == 'url'),
+                             anchor=tk.W if name == 'url' else tk.E)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<Up>", self._on_arrow_key)
+        self.tree.bind("<Down>", self._on_arrow_key)
+        self.tree.bind("<MouseWheel>", lambda event: self._scroll(-1 if event.delta > 0 else 1, 'units'))
+        self.tree.bind("<Button-4>", lambda event: self._scroll(-1, 'units'))
+        self.tree.bind("<Button-5>", lambda event: self._scroll(1, 'units'))
+        self.tree.bind("<Prior>", lambda event: self._scroll(-1, 'pages'))
+        self.tree.bind("<Next>", lambda event: self._scroll(1, 'pages'))
+        self.tree.bind("<Control-a>", self.select_all)
+        self.tree.bind("<Control-c>", self.copy_selection)
+
+    def set_rows(self, rows: Sequence[tuple]) -> None:
+        """
+        Replace the contents of the table, keeping the current sort order.
+        """
+        self.rows = list(rows)
+        self._selected.clear()
+        self._offset = 0
+        self._sort()
+        self._render()
+
+    def append_rows(self, rows: Sequence[tuple]) -> None:
+        """
+        Add rows at the end (or in sort order, if the table is sorted).
+        """
+        self.rows.extend(rows)
+        self._sort()
+        self._render()
+
+    def clear(self) -> None:
+        self.set_rows([])
+
+    def sort_by(self, column: str, descending: bool = None) -> None:
+        """
+        Sort the rows by a column; by default a second sort on the same column reverses it.
+        """
+        if descending is None:
+            descending = column == self.sort_column and not self.sort_descending
+        self.sort_column, self.sort_descending = column, descending
+        for name in self.columns:
+            arrow = (" ▼" if descending else " ▲") if name == column else ""
+            self.tree.heading(name, text=self.headings[name] + arrow)
+        self._sort()
+        self._render()
+
+    def selected_rows(self) -> List[tuple]:
+        """
+        The selected rows, in display order.
+        """
+        return [row for row in self.rows if id(row) in self._selected]
+
+    def select_all(self, event=None) -> str:
+        self._selected = {id(row) for row in self.rows}
+        self._render()
+        return "break"
+
+    def copy_selection(self, event=None) -> str:
+        """
+        Copy the selected rows to the clipboard, one tab-separated line each.
+        """
+        lines = ["\t".join("" if value is None else str(value) for value in row)
+                 for row in self.selected_rows()]
+        if lines:
+            self.clipboard_clear()
+            self.clipboard_append("\n".join(lines))
+        return "break"
+
+    def _sort(self) -> None:
+        if self.sort_column is None:
+            return
+        index = self.columns.index(self.sort_column)
+        # Missing values go last whatever the direction
+        present = [row for row in self.rows if row[index] is not None]
+        missing = [row for row in self.rows if row[index] is None]
+        present.sort(key=itemgetter(index), reverse=self.sort_descending)
+        self.rows = present + missing
+
+    def _render(self) -> None:
+        self._offset = max(0, min(self._offset, len(self.rows) - self.height))
+        visible = self.rows[self._offset:self._offset + self.height]
+        for position, row in enumerate(visible):
+            iid = str(position)
+            values = ["" if value is None else value for value in row]
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert('', tk.END, iid=iid, values=values)
+        for position in range(len(visible), len(self.tree.get_children())):
+            self.tree.delete(str(position))
+        self.tree.selection_set([str(position) for position, row in enumerate(visible)
+                                 if id(row) in self._selected])
+
+        if self.rows:
+            first = self._offset / len(self.rows)
+            self.scrollbar.set(first, first + len(visible) / len(self.rows))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _scroll(self, amount: int, what: str) -> str:
+        step = self.height if what == 'pages' else 1
+        self._offset += int(amount) * step
+        self._render()
+        return "break"
+
+    def _on_scrollbar(self, action, *args) -> None:
+        if action == 'moveto':
+            self._offset = int(float(args[0]) * len(self.rows))
+            self._render()
+        elif action == 'scroll':
+            self._scroll(int(args[0]), args[1])
+
+    def _on_select(self, event=None) -> None:
+        selection = set(self.tree.selection())
+        for position, row in enumerate(self.rows[self._offset:self._offset + self.height]):
+            if str(position) in selection:
+                self._selected.add(id(row))
+            else:
+                self._selected.discard(id(row))
+
+    def _visible_selection(self) -> set:
+        selection = set(self.tree.selection())
+        return {id(row) for position, row in enumerate(self.rows[self._offset:self._offset + self.height])
+                if str(position) in selection}
+
+    def _on_click(self, event) -> None:
+        # A plain click on a row replaces the whole selection. The Treeview only
+        # holds the visible rows, so the off-screen ones are dropped here; with
+        # Ctrl or Shift the click extends the selection as usual.
+        if event.state & (CONTROL_MASK | SHIFT_MASK):
+            return
+        if self.tree.identify_region(event.x, event.y) not in ('cell', 'tree'):
+            return
+        self._selected.clear()
+        iid = self.tree.identify_row(event.y)
+        if iid and self._offset + int(iid) < len(self.rows):
+            self._selected.add(id(self.rows[self._offset + int(iid)]))
+
+    def _on_arrow_key(self, event) -> None:
+        # Moving without Shift selects just the new row: forget the off-screen ones
+        if not event.state & SHIFT_MASK:
+            self._selected = self._visible_selection()
@@ -4,48 +4,275 @@ import subprocess
 import sys
 import random
 import logging
+import threading
 import db
+import history_writer
 import vpn_manager as vpn
+import vpn_selection
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import Scheduler, get_scheduler
 from typing import List, Tuple, Union, Dict, TYPE_CHECKING
 import time
 
 
-def open_urls(app: 'URLManagerGUI', urls_with_ids: List[Tuple[Union[int, str], str]], selected_browser: str, db_config: Dict[str, Union[str, int, float, bool]]) -> None:
+def launch_url(browser_command: str, url: str) -> bool:
+    """
+    Start the browser on one URL without waiting for it.
+
+    Returns:
+        bool: True if the browser process was started.
+    """
+    try:
+        subprocess.Popen([browser_command, url])
+        logging.info(f"Opened URL: {url} at {time.ctime()}")
+        return True
+    except Exception as e:
+        logging.error(f"Failed to open URL: {url}. Error: {e}")
+        return False
+
+
+class RotationPolicy:
+    """
+    When a LaunchSession rotates the VPN: after every `every_urls` launches and/or
+    every `every_minutes` minutes, whichever comes first.
+
+    Args:
+        every_urls: Rotate after this many successful launches (None to disable).
+        every_minutes: Rotate when this long has passed since the last rotation (None to disable).
+        server: Server, country or group code to rotate to; defaults to the browser's vpn code.
+    """
+
+    def __init__(self, every_urls: int = None, every_minutes: float = None, server: str = None):
+        self.every_urls = every_urls
+        self.every_minutes = every_minutes
+        self.server = server
+
+    def due(self, launches_since: int, seconds_since: float) -> bool:
+        return bool((self.every_urls and launches_since >= self.every_urls)
+                    or (self.every_minutes and seconds_since >= 60 * self.every_minutes))
+
+
+# Rotations change machine-wide VPN state, so they run one at a time, off the
+# scheduler's workers because each can take tens of seconds.
+_rotation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vpn-rotation")
+
+
+class LaunchSession:
+    """
+    Opens a list of URLs in one browser, in the order of their IDs, with a random
+    sleep after each, driven by timers on the shared Scheduler.
+
+    The session holds no thread while it sleeps. It can be paused, resumed and
+    cancelled, and its sleep range changed while it runs. Several sessions can run
+    at once: history rows go through the shared write-behind writer and the VPN
+    check holds vpn_manager.vpn_lock, so no launch happens while another thread is
+    changing the VPN.
+
+    Args:
+        browser_name: The browser name, for logging.
+        browser: The browser's configuration from db.get_browsers().
+        urls_with_ids: List of (id, url) tuples to open.
+        sleep_params: (min, max) seconds to sleep between launches.
+        db_config: Database configuration.
+        scheduler: Scheduler to use; defaults to the process-wide one.
+        rotation_policy: Optional RotationPolicy. A due rotation starts in the
+            background at the beginning of the sleep window; the next launch waits
+            for both, and is skipped if the rotation failed.
+    """
+
+    def __init__(self, browser_name: str, browser: Dict, urls_with_ids: List[Tuple[Union[int, str], str]],
+                 sleep_params: Tuple[int, int], db_config: Dict, scheduler: Scheduler = None,
+                 rotation_policy: RotationPolicy = None):
+        self.browser_name = browser_name
+        self.browser = browser
+        self.urls = sorted(urls_with_ids, key=lambda x: x[0])
+        self.sleep_params = tuple(sleep_params)
+        self.db_config = db_config
+        self.history = history_writer.get_history_writer(db_config)
+        self.scheduler = scheduler or get_scheduler()
+        self.rotation_policy = rotation_policy
+        self.stats = {"browser": browser_name, "launched": 0, "failed": 0, "skipped": 0}
+
+        self._lock = threading.RLock()
+        self._next = 0               # index of the next URL to open
+        self._timer = None           # pending TimerHandle, if any
+        self._remaining = None       # delay left when paused
+        self._last_launch = None
+        self._start = None
+        self._rotation = None        # Future of a rotation running in the sleep window
+        self._launches_since_rotation = 0
+        self._last_rotation = time.monotonic()
+        self.paused = False
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def start(self) -> 'LaunchSession':
+        """Schedule the first launch immediately."""
+        with self._lock:
+            self._start = self._last_rotation = time.monotonic()
+            self._schedule(0)
+        return self
+
+    def pause(self) -> None:
+        """Hold the session; the time left before the next launch is kept."""
+        with self._lock:
+            if self.paused or self._done.is_set():
+                return
+            self.paused = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._remaining = max(self._timer.due - time.monotonic(), 0)
+                self._timer = None
+
+    def resume(self) -> None:
+        """Continue a paused session where it stopped."""
+        with self._lock:
+            if not self.paused:
+                return
+            self.paused = False
+            if self._remaining is not None:
+                remaining, self._remaining = self._remaining, None
+                self._schedule(remaining)
+
+    def cancel(self) -> None:
+        """Stop the session; URLs not yet opened are dropped."""
+        with self._lock:
+            self.cancelled = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._finish()
+
+    def set_sleep_params(self, sleep_params: Tuple[int, int]) -> None:
+        """
+        Change the sleep range. The wait in progress is redrawn from the new range,
+        counted from the last launch.
+        """
+        with self._lock:
+            self.sleep_params = tuple(sleep_params)
+            if self._timer is not None and self._last_launch is not None:
+                self._timer.cancel()
+                due = self._last_launch + random.randint(*self.sleep_params)
+                self._timer = None
+                self._schedule(max(due - time.monotonic(), 0))
+
+    def wait(self, timeout: float = None) -> Dict:
+        """Block until the session ends; returns its stats."""
+        self._done.wait(timeout)
+        return self.stats
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _schedule(self, delay: float) -> None:
+        # Caller holds self._lock
+        if self.paused:
+            self._remaining = delay
+        else:
+            self._timer = self.scheduler.call_later(delay, self._launch_next, pass_handle=True)
+
+    def _launch_next(self, handle) -> None:
+        with self._lock:
+            # A timer cancelled or replaced after it fell due may still get here;
+            # only the current one may launch, or the session would run two chains
+            if handle is not self._timer or handle.cancelled:
+                return
+            self._timer = None
+            if self.paused or self.cancelled or self._done.is_set():
+                return
+            if self._next >= len(self.urls):
+                self._finish()
+                return
+            rotation_ok = True
+            if self._rotation is not None:
+                if not self._rotation.done():
+                    # The sleep is over but the rotation is not: launch as soon as it is
+                    self._rotation.add_done_callback(self._on_rotation_done)
+                    return
+                rotation_ok = self._rotation.exception() is None and bool(self._rotation.result())
+                self._rotation = None
+            url_id, url = self.urls[self._next]
+            self._next += 1
+
+        connected = launched = False
+        if not rotation_ok:
+            logging.error(f"{self.browser_name}: VPN rotation failed, skipping {url}")
+        else:
+            logging.info(f"About to launch {self.browser['command']} with {url}")
+            with vpn.vpn_lock:
+                # Cached status from the VPN monitor; no nordvpn process per launch
+                connected = vpn.get_monitor().is_connected()
+                launched = connected and launch_url(self.browser["command"], url)
+
+        with self._lock:
+            now = time.monotonic()
+            self._last_launch = now
+            if not connected:
+                if rotation_ok:
+                    logging.error("VPN is not connected.")
+                self.stats["skipped"] += 1
+            elif launched:
+                # Queued for the background writer, so DB latency stays out of the schedule
+                self.history.record(url_id, self.browser["id"])
+                self.stats["launched"] += 1
+                self._launches_since_rotation += 1
+            else:
+                self.stats["failed"] += 1
+
+            if self.cancelled:
+                return
+            if self._next >= len(self.urls):
+                self._finish()
+                return
+            if self.rotation_policy and self.rotation_policy.due(
+                    self._launches_since_rotation, now - self._last_rotation):
+                # Rotate during the sleep window; the next launch waits for
+                # whichever of the two finishes last.
+                logging.info(f"{self.browser_name}: rotating VPN during the sleep window")
+                self._rotation = _rotation_executor.submit(self._rotate)
+                self._launches_since_rotation = 0
+                self._last_rotation = now
+            # A skipped launch moves straight on, as the old loop did
+            sleep_time = random.randint(*self.sleep_params) if connected else 0
+            logging.info(f"{self.browser_name}: next launch in {sleep_time} seconds")
+            self._schedule(sleep_time)
+
+    def _on_rotation_done(self, future) -> None:
+        with self._lock:
+            if not self._done.is_set() and self._timer is None:
+                self._schedule(0)
+
+    def _rotate(self) -> bool:
+        # Without a fixed server the policy leaves the choice to vpn_selection
+        return vpn_selection.rotate_browser_vpn(self.db_config, self.browser, self.rotation_policy.server)
+
+    def _finish(self) -> None:
+        # Caller holds self._lock
+        if self._done.is_set():
+            return
+        elapsed = time.monotonic() - self._start if self._start is not None else 0.0
+        self.stats["elapsed"] = elapsed
+        self.stats["launches_per_hour"] = 3600 * self.stats["launched"] / elapsed if elapsed else 0.0
+        logging.info(f"Session finished: {self.stats}")
+        self._done.set()
+
+
+def open_urls(app: 'URLManagerGUI', urls_with_ids: List[Tuple[Union[int, str], str]], selected_browser: str, db_config: Dict[str, Union[str, int, float, bool]]) -> LaunchSession:
 # Use forward declaration for app type to avoid circular dependencies
     """
     Open a list of URLs using the command associated with the selected browser.
     Each URL is opened in the browser, followed by a random sleep period, in the order of their IDs.
+    Returns at once; the launches run on the shared scheduler.
     Args:
         app: instance of class URLManagerGUI
         urls_with_ids: List of tuples holdinf the URLs to be opened
         selected_browser:  The browser name as selected by the user.
         db_config: Database configuration.
+    Returns:
+        The running LaunchSession, to pause, resume or cancel it.
     """
-
-    # Ensure the URLs are sorted by ID before opening
-    urls_with_ids_sorted = sorted(urls_with_ids, key=lambda x: x[0])
-
     browsers = app.get_browsers()
-
-    browser_command = browsers[selected_browser]["command"]
-
-    sleep_min, sleep_max = app.get_sleep_params()
-
-    for url_id, url in urls_with_ids_sorted:
-        logging.info(f"About to launch {browser_command} with {url}")
-        if vpn.is_vpn_connected:
-            try:
-                subprocess.Popen([browser_command, url])
-                logging.info(f"Opened URL: {url} at {time.ctime()}")
-                browser_id = browsers[selected_browser]["id"]
-                db.insert_url_open_history(url_id, browser_id, db_config)
-            except Exception as e:
-                logging.error(f"Failed to open URL: {url}. Error: {e}")
-        else:
-            logging.error("VPN is not connected.")
-            continue  
-        
-        sleep_time = random.randint(sleep_min, sleep_max)
-        logging.info(f"Sleeping for {sleep_time} seconds...")
-        time.sleep(sleep_time)
-        logging.info(f"Resuming at {time.ctime()}")
+    return LaunchSession(selected_browser, browsers[selected_browser], urls_with_ids,
+                         app.get_sleep_params(), db_config,
+                         rotation_policy=app.get_rotation_policy()).start()
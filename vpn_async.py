@@ -0,0 +1,133 @@
+# vpn_async.py
+import logging
+import random
+
+import vpn_manager
+from lazy import lazy_import
+
+# asyncio (and the ssl it pulls in) is only needed once a VPN call is made
+asyncio = lazy_import("asyncio")
+
+"""
+Asyncio interface to the nordvpn CLI.
+
+Every call runs nordvpn through asyncio.create_subprocess_exec with its own timeout.
+A call that times out or whose task is cancelled kills the nordvpn process, so a hung
+CLI can never freeze the caller. rotate() retries with exponential backoff and jitter.
+
+The executable is taken from the NORDVPN_BIN environment variable (default "nordvpn"),
+so tools/fake_nordvpn can stand in for it offline.
+
+"""
+
+STATUS_TIMEOUT = 10.0   # seconds
+CONNECT_TIMEOUT = 60.0  # seconds
+ROTATE_ATTEMPTS = 6
+BACKOFF_BASE = 1.0      # seconds before the first retry
+BACKOFF_MAX = 30.0      # cap on the wait between retries
+
+
+class VPNCommandError(RuntimeError):
+    """Raised when nordvpn exits with a non-zero status."""
+
+
+async def run_nordvpn(*args: str, timeout: float = STATUS_TIMEOUT) -> str:
+    """
+    Run nordvpn with the given arguments and return its standard output.
+
+    Raises:
+        asyncio.TimeoutError: If it does not finish within `timeout` seconds.
+        VPNCommandError: If it exits with a non-zero status.
+    """
+    process = await asyncio.create_subprocess_exec(
+        vpn_manager.nordvpn_bin(), *args,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        # Timed out or cancelled: don't leave the CLI running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    if process.returncode != 0:
+        raise VPNCommandError(
+            f"nordvpn {' '.join(args)} exited with {process.returncode}: {stderr.decode().strip()}")
+    return stdout.decode()
+
+
+async def status(timeout: float = STATUS_TIMEOUT) -> dict:
+    """
+    Return the parsed nordvpn status (see vpn_manager.parse_vpn_status).
+    """
+    return vpn_manager.parse_vpn_status(await run_nordvpn("status", timeout=timeout))
+
+
+async def connect(server: str = None, timeout: float = CONNECT_TIMEOUT) -> dict:
+    """
+    Connect to a server, country or group code (nordvpn's choice if None).
+
+    Returns:
+        dict: The parsed status after connecting.
+    """
+    args = ("connect", server) if server else ("connect",)
+    await run_nordvpn(*args, timeout=timeout)
+    return await status()
+
+
+async def disconnect(timeout: float = STATUS_TIMEOUT) -> dict:
+    """
+    Disconnect the VPN.
+
+    Returns:
+        dict: The parsed status after disconnecting.
+    """
+    await run_nordvpn("disconnect", timeout=timeout)
+    return await status()
+
+
+async def rotate(server: str = None, attempts: int = ROTATE_ATTEMPTS,
+                 timeout: float = CONNECT_TIMEOUT) -> bool:
+    """
+    (Re)connect to `server`, retrying with exponential backoff until connected.
+
+    The wait before retry n is a random fraction (50-100%) of
+    min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n), so parallel callers do not retry in step.
+
+    Args:
+        server: Server, country or group code; nordvpn picks one if None.
+        attempts: Maximum number of connection attempts.
+        timeout: Timeout of each connection attempt, in seconds.
+
+    Returns:
+        bool: True once connected, False if every attempt failed.
+    """
+    for attempt in range(attempts):
+        try:
+            result = await connect(server, timeout)
+            if result["status"] == "Connected":
+                logging.info(f"Connected to VPN {server or ''} on attempt {attempt + 1}: {result}")
+                return True
+            logging.warning(f"VPN still {result['status']} after connect attempt {attempt + 1}.")
+        except asyncio.TimeoutError:
+            logging.warning(f"VPN connect attempt {attempt + 1} timed out after {timeout}s.")
+        except (VPNCommandError, OSError) as e:
+            logging.warning(f"VPN connect attempt {attempt + 1} failed: {e}")
+        if attempt + 1 < attempts:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            await asyncio.sleep(delay)
+    logging.error(f"Failed to connect to VPN {server or ''} after {attempts} attempts.")
+    return False
+
+
+def rotate_blocking(server: str = None, **kwargs) -> bool:
+    """
+    Run rotate() to completion from synchronous code, e.g. a worker thread.
+
+    Holds vpn_manager.vpn_lock so no URL is launched mid-rotation, and refreshes
+    the VPN monitor afterwards.
+    """
+    with vpn_manager.vpn_lock:
+        connected = asyncio.run(rotate(server, **kwargs))
+        vpn_manager.get_monitor().refresh(wait=True)
+    return connected
@@ -1,18 +1,33 @@
 # vpn.py
-#from nordvpn_connect import initialize_vpn, rotate_VPN, close_vpn_connection, get_current_ip
-import  nordvpn_connect
-from tkinter import messagebox
 import sys
+import os
 import subprocess
 import re
 import logging
+import threading
+from datetime import datetime
+
+# Held while the VPN is checked before a launch or changed, so concurrent
+# browser sessions never launch a URL in the middle of a reconnect.
+vpn_lock = threading.RLock()
+
+QUERY_TIMEOUT = 10.0  # seconds before a hung nordvpn status is abandoned
+
+
+def nordvpn_bin() -> str:
+    """
+    The nordvpn executable: $NORDVPN_BIN if set (e.g. tools/fake_nordvpn), else "nordvpn".
+    """
+    return os.environ.get("NORDVPN_BIN", "nordvpn")
+
 
 def query_vpn() -> str:
     """
     Run the nordvpn status command and return the result
     """
     try:
-        result = subprocess.run(["nordvpn", "status"], capture_output=True, text=True)
+        result = subprocess.run([nordvpn_bin(), "status"], capture_output=True, text=True,
+                                timeout=QUERY_TIMEOUT)
         logging.info("Successfully retrieved VPN status.")
         return result.stdout
     except Exception as e:
@@ -32,32 +47,155 @@ def is_vpn_connected() -> bool:
         return False
         
 
-def get_vpn_status() -> dict :
+def parse_vpn_status(vpn_output: str) -> dict:
     """
-    Check the current VPN connection status by verifying running nordvpn status and capturing the result.
+    Parse the output of nordvpn status.
+
+    Args:
+        vpn_output: The text printed by nordvpn status.
 
     Returns:
-        The resuls of nordvpn status
+        dict: "status" ("Connected", "Disconnected" or "Unknown") and, when connected,
+        the "hostname", "ip", "country" and "city" lines that are present.
     """
-
-    # Run the nordvpn status command
-    #result = subprocess.run(["nordvpn", "status"], capture_output=True, text=True)
-    #output = result.stdout
-    vpn_output = query_vpn()
-
     # Check if connected or disconnected
     if "Disconnected" in vpn_output:
         return {"status": "Disconnected"}
     elif "Connected" in vpn_output:
         # Parse the output for details
-        details = {}
-        details["status"] = "Connected"
-        details["hostname"] = re.search("Hostname: (.*)", vpn_output).group(1)
-        details["ip"] = re.search("IP: (.*)", vpn_output).group(1)
-        details["country"] = re.search("Country: (.*)", vpn_output).group(1)
-        details["city"] = re.search("City: (.*)", vpn_output).group(1)
-        
+        details = {"status": "Connected"}
+        for key, label in (("hostname", "Hostname"), ("ip", "IP"), ("country", "Country"), ("city", "City")):
+            match = re.search(f"{label}: (.*)", vpn_output)
+            if match:
+                details[key] = match.group(1).strip()
         return details
+    return {"status": "Unknown"}
+
+
+def get_vpn_status() -> dict :
+    """
+    Check the current VPN connection status by verifying running nordvpn status and capturing the result.
+
+    This forks nordvpn every time; prefer get_monitor().snapshot() for frequent checks.
+
+    Returns:
+        The resuls of nordvpn status
+    """
+    return parse_vpn_status(query_vpn())
+
+
+DEFAULT_POLL_INTERVAL = 10.0  # seconds between nordvpn status calls
+
+
+class VPNMonitor:
+    """
+    Background thread that polls nordvpn status and publishes the parsed result.
+
+    Readers get the latest snapshot without forking a process. Listeners are called
+    on the monitor thread whenever the status, server or IP changes.
+
+    Args:
+        interval (float): Seconds between polls.
+    """
+
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self._snapshot = {"status": "Unknown", "checked_at": None}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vpn-monitor", daemon=True)
+
+    def start(self) -> 'VPNMonitor':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def add_listener(self, callback) -> None:
+        """
+        Register callback(snapshot), called from the monitor thread on every change.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback) -> None:
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def snapshot(self) -> dict:
+        """
+        Return a copy of the latest status, with "checked_at" (a datetime, or None
+        before the first poll).
+        """
+        with self._lock:
+            return dict(self._snapshot)
+
+    def is_connected(self) -> bool:
+        """
+        Whether the VPN was connected at the last poll, polling first if there was none.
+        """
+        if self.snapshot()["checked_at"] is None:
+            self.refresh(wait=True)
+        return self.snapshot()["status"] == "Connected"
+
+    def refresh(self, wait: bool = False) -> None:
+        """
+        Poll now instead of at the next interval, e.g. after connecting.
+
+        Args:
+            wait: Poll in the calling thread and return once the snapshot is updated.
+        """
+        if wait:
+            self._poll()
+        else:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._poll()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _poll(self) -> None:
+        with self._poll_lock:
+            status = get_vpn_status()
+            status["checked_at"] = datetime.now()
+            with self._lock:
+                previous = self._snapshot
+                self._snapshot = status
+                listeners = list(self._listeners)
+        changed = any(previous.get(key) != status.get(key) for key in ("status", "hostname", "ip"))
+        if changed:
+            logging.info(f"VPN status changed: {status}")
+            for callback in listeners:
+                try:
+                    callback(dict(status))
+                except Exception:
+                    logging.exception("VPN status listener failed")
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor(interval: float = None) -> VPNMonitor:
+    """
+    Return the process-wide VPN monitor, starting it on first use.
+
+    Args:
+        interval: Poll interval in seconds; only used when the monitor is created.
+    """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = VPNMonitor(interval or DEFAULT_POLL_INTERVAL).start()
+        return _monitor
 
 def check_vpn_status() -> bool :   # We don't actually need this func
     """
@@ -80,94 +218,3 @@ def check_vpn_status() -> bool :   # We don't actually need this func
     # except Exception as e:
     #    logging.error(f"Error checking VPN status: {e}")
     #    return False
-
-def connect_vpn(selected_browser, browsers) -> bool:
-    """
-    Establish a VPN connection using the selected browser's VPN settings.
-
-    Args:
-        selected_browser (str): The browser name as selected by the user.
-        browsers (dict): Dictionary containing browser configuration, including VPN settings.
-
-    Returns:
-        bool: True if the VPN connection was successfully established, False otherwise.
-    """
-    server_code = browsers[selected_browser]["vpn"]
-    settings = initialize_vpn(server_code)
-
-    # Attempt to connect to the VPN with retry logic
-    if not attempt_vpn_rotation(settings):
-        logging.error(f"Failed to connect to VPN server {server_code} after retries.")
-        close_vpn_connection(settings)  # Ensure to close any partially established connections
-        return False
-    else:
-        return True
-    
-
-def disconnect_vpn() -> bool:
-    """
-    Disconnect from the VPN
-
-    Returns:
-        bool: True if the VPN disconnection was successfully established, False otherwise.
-    """
-
-    # Define the parameters dictionary, including the required 'platform' key
-    parameters = {
-        "platform": "linux",  # Adjust according to your operating system (e.g., "windows" or "macos")
-        # Include other required parameters if applicable
-    }
-
-    try:
-        # Attempt to close the VPN connection
-        result = nordvpn_connect.close_vpn_connection(parameters)
-
-        if result is None:
-            messagebox.showinfo("VPN Connection", "VPN successfully disconnected.")
-        else:
-            messagebox.showerror("VPN Disconnection Failed", "Unexpected output during disconnection.")
-        
-        # Optionally, update the VPN status display or application state
-            #self.update_vpn_status_display()
-
-    except KeyError as e:
-        logging.error("Missing key in parameters during VPN disconnection", exc_info=e)
-        messagebox.showerror("VPN Disconnection Error", f"Missing key in parameters: {e}")
-
-    except Exception as e:
-        logging.critical("Unexpected error during VPN disconnection", exc_info=e)
-        messagebox.showerror("VPN Disconnection Failed", f"An unexpected error occurred: {str(e)}")
-
-
-def attempt_vpn_rotation(settings, retries=5) -> bool:
-    """
-    Attempts to rotate the VPN connection with retry logic.
-
-    Args:
-        settings: The VPN settings to use for the connection.
-        retries (int): Number of times to retry the connection attempt.
-
-    Returns:
-        bool: True if the VPN connection was successfully established, False otherwise.
-    """
-    print(f"Settings are {settings}")
-    for attempt in range(retries + 1):  # Include initial attempt + retries
-        try:
-            print(f"About to rotate VPN with {settings} parameter")
-            rotate_VPN(settings)
-            if check_vpn_status():
-                print("connected to VPN \n")
-                if attempt > 0:
-                    print(f"Successfully connected to VPN after {attempt} retries.")
-                else:
-                    print("Successfully connected to VPN. Whoa !")
-                return True
-            else:
-                print("Not connected to vpn \n")
-        except Exception as e:
-            print(f"Error rotating VPN on attempt {attempt}: {e}")
-        if attempt < retries:
-            print("Retrying...")
-        else:
-            print("Failed to connect to VPN after multiple attempts.")
-    return False
\ No newline at end of file
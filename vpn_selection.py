@@ -0,0 +1,117 @@
+# vpn_selection.py
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import db
+import vpn_async
+
+"""
+Chooses which VPN server code a browser rotates to, from its measured history.
+
+A browser's `vpn_code` may list several candidate codes separated by commas. Every
+rotation's duration and outcome is stored in vpn_rotation_history, and the next
+server is picked with UCB1: each candidate scores its mean reward over its recent
+rotations plus an exploration bonus that shrinks the more it has been tried. A
+failed rotation earns 0 and a successful one 1 / (1 + seconds / LATENCY_SCALE), so
+servers that are both reliable and quick to connect win.
+
+"""
+
+HISTORY_DAYS = 14        # how far back rotations count
+WINDOW = 50              # most recent rotations per server that count
+LATENCY_SCALE = 10.0     # seconds at which a success earns half the reward
+EXPLORATION = 0.5        # weight of the UCB exploration bonus
+
+
+def candidate_servers(browser: Dict) -> List[str]:
+    """
+    The server codes a browser may use, from its comma-separated vpn code.
+    """
+    return [code.strip() for code in (browser.get("vpn") or "").split(",") if code.strip()]
+
+
+def server_stats(db_config: Dict, browser: Dict) -> Dict[str, Dict]:
+    """
+    Summarise a browser's recent rotations per candidate server.
+
+    Returns:
+        dict: For each candidate server code, the number of 'attempts', 'successes',
+        'success_rate', 'avg_seconds' of successful connects (None if none) and
+        mean 'reward'.
+    """
+    since = datetime.now() - timedelta(days=HISTORY_DAYS)
+    rows = db.get_vpn_rotations(db_config, browser["id"], since)
+    per_server = {code: [] for code in candidate_servers(browser)}
+    for server_code, duration_ms, success in rows:
+        recent = per_server.get(server_code)
+        if recent is not None and len(recent) < WINDOW:
+            recent.append((duration_ms / 1000.0, bool(success)))
+
+    stats = {}
+    for code, recent in per_server.items():
+        successes = [seconds for seconds, success in recent if success]
+        rewards = [1.0 / (1.0 + seconds / LATENCY_SCALE) if success else 0.0 for seconds, success in recent]
+        stats[code] = {
+            "attempts": len(recent),
+            "successes": len(successes),
+            "success_rate": len(successes) / len(recent) if recent else None,
+            "avg_seconds": sum(successes) / len(successes) if successes else None,
+            "reward": sum(rewards) / len(rewards) if rewards else None,
+        }
+    return stats
+
+
+def choose_server(stats: Dict[str, Dict]) -> str:
+    """
+    Pick a server code by UCB1 over the per-server stats from server_stats().
+
+    Untried servers are chosen first, in listed order.
+    """
+    if not stats:
+        raise ValueError("No candidate VPN servers.")
+    for code, entry in stats.items():
+        if entry["attempts"] == 0:
+            return code
+    total = sum(entry["attempts"] for entry in stats.values())
+    return max(stats, key=lambda code: stats[code]["reward"]
+               + EXPLORATION * math.sqrt(2 * math.log(total) / stats[code]["attempts"]))
+
+
+def rotate_browser_vpn(db_config: Dict, browser: Dict, server: str = None) -> bool:
+    """
+    Rotate the VPN for a browser and record how it went.
+
+    Args:
+        db_config: Database configuration.
+        browser: The browser's configuration from db.get_browsers().
+        server: Fixed server code; by default one is chosen with choose_server().
+
+    Returns:
+        bool: True if the VPN is connected afterwards.
+    """
+    if server is None:
+        candidates = candidate_servers(browser)
+        if len(candidates) > 1:
+            try:
+                server = choose_server(server_stats(db_config, browser))
+            except Exception as e:
+                # Selection is an optimisation; never let it block a rotation
+                logging.error(f"VPN server selection failed, using {candidates[0]}: {e}")
+                server = candidates[0]
+        else:
+            server = candidates[0] if candidates else None
+
+    started_at = datetime.now()
+    start = time.monotonic()
+    connected = False
+    try:
+        connected = vpn_async.rotate_blocking(server)
+    finally:
+        duration_ms = 1000 * (time.monotonic() - start)
+        logging.info(f"VPN rotation to {server} took {duration_ms / 1000:.1f}s, success={connected}")
+        if server:
+            db.insert_vpn_rotation(db_config, browser["id"], server, started_at, duration_ms, connected)
+    return connected
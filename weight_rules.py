@@ -0,0 +1,136 @@
+# weight_rules.py
+from __future__ import annotations
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from lazy import lazy_import
+
+np = lazy_import("numpy")
+
+"""
+Rules that infer a URL's sampling weight from the page number it contains.
+
+Rules come from the optional `weight_rules` section of config.yml, with per-domain
+overrides. Every key is optional; the defaults reproduce the original hard-coded
+thresholds:
+
+    weight_rules:
+      pattern: 'page=(\\d+)'         # regex whose first group is the page number
+      thresholds: [10, 20, 50, 100]  # page <= 10 -> 1st weight, <= 20 -> 2nd, ...
+      weights: [1, 2, 3, 4, 5]       # one more weight than thresholds
+      missing_weight: null           # weight when the pattern is absent; null rejects
+      domains:
+        some_domain:
+          thresholds: [5, 10]
+          weights: [1, 3, 5]
+
+"""
+
+DEFAULT_RULE = {
+    'pattern': r'page=(\d+)',
+    'thresholds': [10, 20, 50, 100],
+    'weights': [1, 2, 3, 4, 5],
+    'missing_weight': None,
+}
+
+
+class WeightRule:
+    """
+    One set of page-number thresholds, applied to single URLs or whole batches.
+    """
+
+    def __init__(self, pattern: str, thresholds: Sequence[int], weights: Sequence[int],
+                 missing_weight: Optional[int] = None):
+        if len(weights) != len(thresholds) + 1:
+            raise ValueError("weight_rules needs exactly one more weight than thresholds.")
+        if list(thresholds) != sorted(thresholds):
+            raise ValueError("weight_rules thresholds must be in ascending order.")
+        self.pattern = re.compile(pattern)
+        self.thresholds = np.asarray(thresholds, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.int64)
+        self.missing_weight = missing_weight
+
+    def infer(self, url: str) -> int:
+        """
+        Infer the weight of one URL.
+
+        Raises:
+            ValueError: If the URL has no page number and there is no missing_weight.
+        """
+        weights, valid = self.infer_many([url])
+        if not valid[0]:
+            raise ValueError(f"The URL does not match the page pattern '{self.pattern.pattern}'.")
+        return int(weights[0])
+
+    def infer_many(self, urls: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Infer the weights of a batch of URLs.
+
+        The page numbers are pulled out with the compiled pattern and mapped to
+        weights in one np.digitize call.
+
+        Returns:
+            tuple: (weights, valid) arrays. valid is False where the URL has no page
+            number and there is no missing_weight; the weight there is meaningless.
+        """
+        matches = [self.pattern.search(url) for url in urls]
+        valid = np.fromiter((match is not None for match in matches), dtype=bool, count=len(matches))
+        pages = np.fromiter((int(match.group(1)) if match else 0 for match in matches),
+                            dtype=np.int64, count=len(matches))
+        # right=True puts page == threshold in the lower band, i.e. "page <= threshold"
+        weights = self.weights[np.digitize(pages, self.thresholds, right=True)]
+        if self.missing_weight is not None:
+            weights[~valid] = self.missing_weight
+            valid[:] = True
+        return weights, valid
+
+
+class WeightRules:
+    """
+    The default WeightRule plus per-domain overrides.
+    """
+
+    def __init__(self, default: WeightRule, domains: Optional[dict] = None):
+        self.default = default
+        self.domains = domains or {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'WeightRules':
+        """
+        Build the rules from the full config dictionary (see the module docstring).
+        """
+        section = dict(config.get('weight_rules') or {})
+        domain_sections = section.pop('domains', None) or {}
+        base = dict(DEFAULT_RULE, **section)
+        domains = {domain: WeightRule(**dict(base, **overrides))
+                   for domain, overrides in domain_sections.items()}
+        return cls(WeightRule(**base), domains)
+
+    def rule_for(self, domain: Optional[str]) -> WeightRule:
+        return self.domains.get(domain, self.default)
+
+    def infer(self, url: str, domain: Optional[str] = None) -> int:
+        """
+        Infer the weight of one URL under its domain's rule.
+
+        Raises:
+            ValueError: If the URL has no page number and its rule has no missing_weight.
+        """
+        return self.rule_for(domain).infer(url)
+
+    def infer_many(self, urls: List[str], domains: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Infer the weights of a batch of URLs, each under its own domain's rule.
+
+        Returns:
+            tuple: (weights, valid) arrays, as WeightRule.infer_many().
+        """
+        weights = np.zeros(len(urls), dtype=np.int64)
+        valid = np.zeros(len(urls), dtype=bool)
+        domain_array = np.asarray(domains, dtype=object)
+        for domain in set(domains):
+            positions = np.flatnonzero(domain_array == domain)
+            rule_weights, rule_valid = self.rule_for(domain).infer_many(urls[i] for i in positions)
+            weights[positions] = rule_weights
+            valid[positions] = rule_valid
+        return weights, valid